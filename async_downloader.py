@@ -0,0 +1,186 @@
+"""Download many URLs concurrently from a single thread, with asyncio.
+
+A thread per URL is fine for a handful of downloads, but every thread needs its own stack and OS resources,
+and with tens of thousands of URLs we run out of them. With asyncio all the downloads run in a single thread:
+a download that waits for the network simply yields control to the event loop, which resumes another one.
+So the number of concurrent downloads is only limited by the number of sockets we can open.
+
+The concurrency is bounded by a semaphore (--concurrency), and by a semaphore for each host (--per-host),
+so we do not flood a single server with connections. Each response is streamed to disk chunk by chunk,
+so the memory used does not depend on the size of the files.
+The HTTP client is a minimal HTTP/1.0 client built on `asyncio.open_connection`, which follows redirects.
+A response with a status other than 2xx raises a RuntimeError, and nothing is written to disk.
+The timeout applies to each network operation (connecting, sending the request, each read), not to the whole download,
+so a large file can take as long as it needs as long as the data keeps flowing.
+
+To open more than ~1000 connections at once you may need to raise the limit of open files (e.g. `ulimit -n 65536`).
+
+Usage:
+    $ python async_downloader.py
+    $ python async_downloader.py --repeat 1000 --concurrency 2000 --per-host 100
+    # one URL per line
+    $ python async_downloader.py --urls urls.txt --output-dir downloads
+
+See Also:
+    create_threads_pythonic.py
+    http_downloader.py
+    io_bound_operation.py
+"""
+import os
+import ssl
+import time
+import asyncio
+import argparse
+import urllib.parse
+from argparse import RawDescriptionHelpFormatter
+from collections import defaultdict
+
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class AsyncDownloader:
+
+    def __init__(
+        self, concurrency=1000, per_host=10, chunk_size=64 * 1024, timeout=60.0, max_redirects=5
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.host_semaphores = defaultdict(lambda: asyncio.Semaphore(per_host))
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.ssl_context = ssl.create_default_context()
+
+    async def download_url(self, file_name, url):
+        async with self.semaphore:
+            for _ in range(self.max_redirects + 1):
+                host = urllib.parse.urlsplit(url).netloc
+                async with self.host_semaphores[host]:
+                    status, location = await self.get(file_name, url)
+                if location is None:
+                    return status
+                url = urllib.parse.urljoin(url, location)
+            raise RuntimeError(f"Too many redirects for {url}")
+
+    async def download_all(self, downloads):
+        # return_exceptions=True, so one failed download does not cancel all the others
+        return await asyncio.gather(
+            *(self.download_url(file_name, url) for file_name, url in downloads),
+            return_exceptions=True,
+        )
+
+    async def io(self, awaitable):
+        # a timeout for each network operation, so a download fails only if the connection stalls
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+    async def get(self, file_name, url):
+        parsed = urllib.parse.urlsplit(url)
+        https = parsed.scheme == "https"
+        port = parsed.port or (443 if https else 80)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+
+        reader, writer = await self.io(
+            asyncio.open_connection(parsed.hostname, port, ssl=self.ssl_context if https else None)
+        )
+        try:
+            # HTTP/1.0, so the server does not use chunked encoding and closes the connection at the end of the body
+            request = f"GET {path} HTTP/1.0\r\nHost: {parsed.netloc}\r\nConnection: close\r\n\r\n"
+            writer.write(request.encode("latin-1"))
+            await self.io(writer.drain())
+
+            status_line = await self.io(reader.readline())
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = await self.io(reader.readline())
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if status in REDIRECT_CODES and "location" in headers:
+                return status, headers["location"]
+            if not 200 <= status < 300:
+                raise RuntimeError(f"Download of {url} failed with HTTP status {status}")
+
+            # stream the body to disk, one chunk at a time
+            with open(file_name, "wb") as f:
+                while True:
+                    chunk = await self.io(reader.read(self.chunk_size))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            return status, None
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+
+def download_url(file_name, url):
+    # same interface as the download_url of the thread-based scripts
+    return asyncio.run(AsyncDownloader().download_url(file_name, url))
+
+
+def download_urls(downloads, concurrency=1000, per_host=10):
+    async def main():
+        downloader = AsyncDownloader(concurrency=concurrency, per_host=per_host)
+        return await downloader.download_all(downloads)
+
+    return asyncio.run(main())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--urls", help="File with one URL per line")
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Number of times each URL is downloaded"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1000, help="Maximum number of concurrent downloads"
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=10, help="Maximum number of concurrent downloads per host"
+    )
+    parser.add_argument(
+        "--output-dir", default=".", help="Directory where the files are downloaded"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.urls:
+        with open(args.urls) as f:
+            urls = [line.strip() for line in f if line.strip()]
+    else:
+        urls = [
+            "http://www.google.com",
+            "http://www.python.org",
+            "http://www.bing.com",
+            "http://www.yahoo.com",
+        ]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    downloads = [
+        (os.path.join(args.output_dir, f"Async_{i}_{j}"), url)
+        for i, url in enumerate(urls)
+        for j in range(args.repeat)
+    ]
+
+    start = time.time()
+    results = download_urls(downloads, args.concurrency, args.per_host)
+    end = time.time()
+    for (file_name, url), result in zip(downloads, results):
+        if isinstance(result, Exception):
+            print(f"Download of {url} into {file_name} failed: {result!r}")
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(
+        f"{len(downloads) - failed}/{len(downloads)} downloads in a single thread took {(end - start):.2f} seconds"
+    )
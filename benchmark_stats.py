@@ -0,0 +1,30 @@
+"""Statistics shared by the benchmarks of this repository.
+
+See Also:
+    executor_benchmark.py
+    producer_consumer_metrics.py
+    shared_memory_ring.py
+    thumbnail_benchmark.py
+"""
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def with_baseline(workers):
+    # the speedup is measured with respect to 1 worker, so a run with 1 worker is always included
+    return sorted(set(workers) | {1})
+
+
+def add_scaling(results, group_key, throughput_key):
+    """Add the speedup and the efficiency of each result, with respect to the result with 1 worker of its group."""
+    baselines = {r[group_key]: r[throughput_key] for r in results if r["workers"] == 1}
+    for r in results:
+        r["speedup"] = r[throughput_key] / baselines[r[group_key]]
+        r["efficiency"] = r["speedup"] / r["workers"]
+    return results
@@ -1,12 +1,41 @@
 """Example of a CPU bound operation.
 
+By default each thread calculates the same factorial, and the GIL makes the threads run one at a time.
+
+With --parallel the workers calculate ONE factorial together. The range 1..number is split in sub-ranges,
+and a pool of processes calculates the product of each sub-range. The partial products are then multiplied
+with a balanced binary product tree: (a*b)*(c*d) instead of ((a*b)*c)*d.
+Multiplying two big integers of similar size is much cheaper than growing one huge integer by a small factor
+at each step, so the product tree is faster than the left-to-right loop even with a single worker.
+
+On a free-threaded build of CPython with the GIL disabled, threads can run the sub-products in parallel,
+so --parallel uses a pool of threads instead of processes (see --executor).
+
 Usage:
-    $ python cpu_bound_operation.py
+    $ python cpu_bound_operation.py 4
+    # 4 processes calculate a single factorial
+    $ python cpu_bound_operation.py 4 --parallel --check
+    # compare all the ways of running the threads with 1..4 workers
+    $ python cpu_bound_operation.py 4 --benchmark
+
+See Also:
+    executor_benchmark.py
 """
+import math
 import time
 import argparse
 from argparse import RawDescriptionHelpFormatter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from threading import Thread
+from executor_benchmark import (
+    MODES,
+    benchmark,
+    cpu_executor_class,
+    gil_status,
+    make_workload,
+    print_table,
+    worker_count,
+)
 
 
 def calculate_factorial(number):
@@ -16,32 +45,109 @@ def calculate_factorial(number):
     return factorial
 
 
+def range_product(low, high):
+    # product of low..high (inclusive), splitting the range in halves so the operands have similar sizes
+    if high - low < 16:
+        result = 1
+        for n in range(low, high + 1):
+            result *= n
+        return result
+    mid = (low + high) // 2
+    return range_product(low, mid) * range_product(mid + 1, high)
+
+
+def product_tree(factors):
+    factors = list(factors)
+    if not factors:
+        return 1
+    while len(factors) > 1:
+        paired = [factors[i] * factors[i + 1] for i in range(0, len(factors) - 1, 2)]
+        if len(factors) % 2:
+            paired.append(factors[-1])
+        factors = paired
+    return factors[0]
+
+
+def parallel_factorial(number, num_workers, chunks_per_worker=4, executor_class=None):
+    # by default processes, or threads when the GIL is disabled
+    # more chunks than workers, so a slow worker does not hold back the others
+    num_chunks = max(1, min(number, num_workers * chunks_per_worker))
+    bounds = [1 + i * number // num_chunks for i in range(num_chunks + 1)]
+    lows = bounds[:-1]
+    highs = [bound - 1 for bound in bounds[1:]]
+    highs[-1] = number
+    executor_class = executor_class or cpu_executor_class()
+    with executor_class(max_workers=num_workers) as executor:
+        partial_products = list(executor.map(range_product, lows, highs))
+    return product_tree(partial_products)
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
     parser.add_argument(
         "num_threads",
-        type=int,
-        choices=[1, 2, 3, 4],
+        type=worker_count,
         help="Number of threads to spawn and use",
     )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare threads, processes, pools and asyncio with 1..num_threads workers (see executor_benchmark.py)",
+    )
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        action="store_true",
+        help="Calculate a single factorial with a pool of workers and a product tree",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["auto", "processes", "threads"],
+        default="auto",
+        help="Pool used with --parallel (auto: threads if the GIL is disabled, processes otherwise)",
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="Compare the result with math.factorial"
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     number = 100000
     args = parse_args()
+    print(gil_status())
 
-    start = time.time()
-    threads = []
-    for _ in range(args.num_threads):
-        t = Thread(target=calculate_factorial, args=(number,))
-        threads.append(t)
-        t.start()
+    if args.benchmark:
+        task, async_task = make_workload("factorial", number=number)
+        print_table(benchmark(MODES, range(1, args.num_threads + 1), task, async_task))
+    elif args.parallel:
+        start = time.time()
+        executor_class = {
+            "auto": cpu_executor_class(),
+            "processes": ProcessPoolExecutor,
+            "threads": ThreadPoolExecutor,
+        }[args.executor]
+        factorial = parallel_factorial(number, args.num_threads, executor_class=executor_class)
+        end = time.time()
+        kind = "threads" if executor_class is ThreadPoolExecutor else "processes"
+        print(
+            f"Parallel factorial of {number} with {args.num_threads} {kind} took {(end - start):.2f} seconds"
+        )
+        if args.check:
+            assert factorial == math.factorial(number), "wrong result"
+            print("Result checked against math.factorial")
+    else:
+        start = time.time()
+        threads = []
+        for _ in range(args.num_threads):
+            t = Thread(target=calculate_factorial, args=(number,))
+            threads.append(t)
+            t.start()
 
-    for t in threads:
-        t.join()
+        for t in threads:
+            t.join()
 
-    end = time.time()
-    print(f"Processing with {args.num_threads} threads took {(end - start):.2f} seconds")
+        end = time.time()
+        print(f"Processing with {args.num_threads} threads took {(end - start):.2f} seconds")
@@ -1,7 +1,6 @@
-import urllib3
+import argparse
 import threading
-
-urllib3.disable_warnings()
+from http_downloader import add_resume_arguments, make_downloader
 
 
 def download_url(file_name, url):
@@ -15,10 +14,12 @@ def download_url(file_name, url):
             url, file_name, threading.current_thread().name
         )
     )
-    http = urllib3.PoolManager()
-    response = http.request(method="GET", url=url)
-    with open(file_name, "wb") as f:
-        f.write(response.data)
+    # all threads share the same pool of keep-alive connections
+    try:
+        downloader.download(file_name, url)
+    except Exception as e:
+        print("Download of {} failed: {}".format(url, e))
+        return
     print("Download of {} done".format(url))
 
 
@@ -30,6 +31,12 @@ test_dict = {
     "Yahoo": "http://www.yahoo.com",
 }
 
+parser = argparse.ArgumentParser(description="Fetch multiple URLs with one thread each.")
+add_resume_arguments(parser)
+args = parser.parse_args()
+# shared by all the threads: one pool of keep-alive connections and, with --resume, one journal
+downloader = make_downloader(args)
+
 print("Main thread starting execution...")
 for key in test_dict:
     thread = threading.Thread(
@@ -1,28 +1,29 @@
 """Fetch multiple URLs with one thread each.
 
 This program shows a more Java-way style of creating threads.
+With --resume each download records its progress in a journal, so an interrupted run continues where it stopped.
 """
-import urllib3
+import argparse
 from threading import Thread
-
-# disable warning for untrusted certificates
-urllib3.disable_warnings()
+from http_downloader import downloader, add_resume_arguments, make_downloader
 
 
 class URLDownload(Thread):
 
-    def __init__(self, file_name, url):
+    def __init__(self, file_name, url, downloader=downloader):
         Thread.__init__(self)
         self.file_name = "Thread_" + file_name
         self.url = url
+        self.downloader = downloader
 
     def run(self):
         print("Downloading the contents of {} into {}".format(self.url, self.file_name))
-        http = urllib3.PoolManager()
-
-        response = http.request(method="GET", url=self.url)
-        with open(self.file_name, "wb") as f:
-            f.write(response.data)
+        # all threads share the same pool of keep-alive connections
+        try:
+            self.downloader.download(self.file_name, self.url)
+        except Exception as e:
+            print("Download of {} failed: {}".format(self.url, e))
+            return
 
         print("Download of {} done".format(self.url))
 
@@ -35,9 +36,15 @@ test_dict = {
     "Yahoo": "http://www.yahoo.com",
 }
 
+parser = argparse.ArgumentParser(description=__doc__)
+add_resume_arguments(parser)
+args = parser.parse_args()
+# shared by all the threads: one pool of keep-alive connections and, with --resume, one journal
+script_downloader = make_downloader(args)
+
 print("Main thread starting execution...")
 for key in test_dict:
-    thread = URLDownload(key, test_dict[key])
+    thread = URLDownload(key, test_dict[key], script_downloader)
     threads.append(thread)
     thread.start()
 
@@ -4,12 +4,11 @@ This program shows a more pythonic style of creating threads.
 This program creates a new thread for each download request.
 You can see the name thread of each thread when it runs, thanks
 to threading.current_thread().name.
+With --resume each download records its progress in a journal, so an interrupted run continues where it stopped.
 """
-import urllib3
+import argparse
 import threading
-
-# disable warning for untrusted certificates
-urllib3.disable_warnings()
+from http_downloader import add_resume_arguments, make_downloader
 
 
 def download_url(file_name, url):
@@ -18,11 +17,12 @@ def download_url(file_name, url):
             url, file_name, threading.current_thread().name
         )
     )
-    http = urllib3.PoolManager()
-
-    response = http.request(method="GET", url=url)
-    with open(file_name, "wb") as f:
-        f.write(response.data)
+    # all threads share the same pool of keep-alive connections
+    try:
+        downloader.download(file_name, url)
+    except Exception as e:
+        print("Download of {} failed: {}".format(url, e))
+        return
 
     print("Download of {} done".format(url))
 
@@ -35,6 +35,12 @@ test_dict = {
     "Yahoo": "http://www.yahoo.com",
 }
 
+parser = argparse.ArgumentParser(description=__doc__)
+add_resume_arguments(parser)
+args = parser.parse_args()
+# shared by all the threads: one pool of keep-alive connections and, with --resume, one journal
+downloader = make_downloader(args)
+
 print("Main thread starting execution...")
 for key in test_dict:
     thread = threading.Thread(target=download_url, name=key, args=(key, test_dict[key]))
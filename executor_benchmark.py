@@ -0,0 +1,394 @@
+"""Run the same workload with threads, processes, a thread pool, a process pool and asyncio, and compare them.
+
+cpu_bound_operation.py, io_bound_operation.py and multiprocessing_multithreading_comparison.py each time a single run
+with a single number of workers. Here every mode is run with 1..cpu_count()*k workers (k is --oversubscription),
+each run is repeated a few times after some warmup runs that are not measured, and we record both the wall time
+and the CPU time (of this process and of its child processes) of each run.
+
+Each worker executes --tasks-per-worker tasks, so the total work grows with the number of workers:
+with perfect scaling the wall time stays the same and the throughput grows linearly.
+The speedup and the efficiency are computed with respect to the same mode with 1 worker
+(a run with 1 worker is always included, even if it is not in --workers).
+The CPU time divided by the wall time tells how many cores were busy on average: with CPU bound tasks it stays close to 1
+with threads, because of the GIL, while it grows with the number of workers with processes.
+The gap between processes and the process pool, and between processes and threads with 1 worker,
+is the cost of starting the processes (and of pickling the tasks for the pool).
+
+Modes:
+    threads         one threading.Thread per worker
+    processes       one multiprocessing.Process per worker
+    thread-pool     concurrent.futures.ThreadPoolExecutor
+    process-pool    concurrent.futures.ProcessPoolExecutor (the time to start the pool is included)
+    asyncio         one coroutine per task on a single event loop, at most `workers` at a time.
+                    A CPU bound task has no await, so it blocks the event loop while it runs.
+
+Workloads:
+    factorial       the factorial of --number, as in cpu_bound_operation.py (CPU bound)
+    sleep           time.sleep / asyncio.sleep (waiting, like an IO bound task on a slow network)
+    download        download --url and discard the body (IO bound)
+
+The results are printed as a table, and saved as JSON (--output) and optionally as CSV (--csv).
+
+On a free-threaded build of CPython (3.13t and later) the GIL can be disabled, and threads run CPU bound tasks in parallel.
+The report tells whether the GIL was enabled. With --compare-gil the benchmark is run twice, in a child interpreter
+started with `-X gil=1` and in one started with `-X gil=0`, so we can compare the scaling of the same workload
+with and without the GIL. On a build with the GIL only the first run is possible.
+
+Usage:
+    $ python executor_benchmark.py
+    $ python executor_benchmark.py --workload sleep --seconds 0.1 --oversubscription 8
+    $ python executor_benchmark.py --modes threads processes --workers 1 2 4 8 --repeat 5 --csv results.csv
+    $ python executor_benchmark.py --workload download --url http://www.7-zip.org/a/7z1701.msi
+    # on a free-threaded build, e.g. python3.13t
+    $ python3.13t executor_benchmark.py --compare-gil --modes threads processes
+
+See Also:
+    cpu_bound_operation.py
+    io_bound_operation.py
+    multiprocessing_multithreading_comparison.py
+"""
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import resource
+import sysconfig
+import subprocess
+import statistics
+import threading
+import tempfile
+import urllib.request
+import multiprocessing
+from argparse import RawDescriptionHelpFormatter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from async_downloader import AsyncDownloader
+from benchmark_stats import add_scaling, with_baseline
+
+
+MODES = ["threads", "processes", "thread-pool", "process-pool", "asyncio"]
+WORKLOADS = ["factorial", "sleep", "download"]
+CHUNK_SIZE = 64 * 1024
+# set in the environment of the child interpreters started by --compare-gil, so they never start children themselves
+COMPARE_GIL_CHILD = "EXECUTOR_BENCHMARK_COMPARE_GIL_CHILD"
+
+
+def worker_count(value):
+    # argparse type for the number of workers of the scripts, which used to accept only 1, 2, 3 or 4
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"the number of workers must be at least 1, got {number}")
+    return number
+
+
+def free_threaded_build():
+    # True if this interpreter was built with --disable-gil (python3.13t and later)
+    return bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+
+
+def gil_enabled():
+    # the GIL can also be enabled at runtime on a free-threaded build (PYTHON_GIL=1, -X gil=1,
+    # or importing an extension module which does not support running without it)
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def gil_status():
+    build = "free-threaded build" if free_threaded_build() else "default build"
+    state = "enabled" if gil_enabled() else "disabled"
+    return f"Python {sys.version.split()[0]} ({build}), GIL {state}"
+
+
+def cpu_executor_class():
+    # without the GIL threads run CPU bound code in parallel, and they are much cheaper to start than processes
+    return ProcessPoolExecutor if gil_enabled() else ThreadPoolExecutor
+
+
+def default_workers(oversubscription=2):
+    return list(range(1, multiprocessing.cpu_count() * oversubscription + 1))
+
+
+def calculate_factorial(number):
+    factorial = 1
+    for n in range(1, number + 1):
+        factorial *= n
+    return factorial
+
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        while response.read(CHUNK_SIZE):
+            pass
+
+
+async def async_fetch(url):
+    await AsyncDownloader().download_url(os.devnull, url)
+
+
+async def run_inline(task):
+    # a blocking call inside a coroutine: the event loop cannot run anything else meanwhile
+    task()
+
+
+def make_workload(name, number=100000, seconds=0.05, url=None):
+    """Return the task for the workload and its asyncio counterpart, a function returning a coroutine."""
+    if name == "factorial":
+        task = partial(calculate_factorial, number)
+        return task, partial(run_inline, task)
+    if name == "sleep":
+        return partial(time.sleep, seconds), partial(asyncio.sleep, seconds)
+    if name == "download":
+        if url is None:
+            raise ValueError("The download workload needs a URL")
+        return partial(fetch, url), partial(async_fetch, url)
+    raise ValueError(f"Unknown workload {name}")
+
+
+def run_tasks(task, num_tasks):
+    # the result is discarded, so a process pool does not send a huge factorial back to the parent
+    for _ in range(num_tasks):
+        task()
+
+
+def run_mode(mode, task, async_task, num_workers, tasks_per_worker):
+    num_tasks = num_workers * tasks_per_worker
+    if mode in ("threads", "processes"):
+        worker_class = threading.Thread if mode == "threads" else multiprocessing.Process
+        workers = [
+            worker_class(target=run_tasks, args=(task, tasks_per_worker)) for _ in range(num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    elif mode in ("thread-pool", "process-pool"):
+        executor_class = ThreadPoolExecutor if mode == "thread-pool" else ProcessPoolExecutor
+        with executor_class(max_workers=num_workers) as executor:
+            list(executor.map(run_tasks, [task] * num_tasks, [1] * num_tasks))
+    elif mode == "asyncio":
+        async def main():
+            semaphore = asyncio.Semaphore(num_workers)
+
+            async def bounded():
+                async with semaphore:
+                    await async_task()
+
+            await asyncio.gather(*(bounded() for _ in range(num_tasks)))
+
+        asyncio.run(main())
+    else:
+        raise ValueError(f"Unknown mode {mode}")
+
+
+def cpu_time():
+    # getrusage has microsecond resolution, os.times() only counts clock ticks (10 ms).
+    # The CPU time of the child processes is added to RUSAGE_CHILDREN when they are joined
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def measure(mode, task, async_task, num_workers, tasks_per_worker):
+    start_cpu = cpu_time()
+    start = time.perf_counter()
+    run_mode(mode, task, async_task, num_workers, tasks_per_worker)
+    wall = time.perf_counter() - start
+    return {"wall": wall, "cpu": cpu_time() - start_cpu}
+
+
+def benchmark(modes, workers, task, async_task, warmup=1, repeat=3, tasks_per_worker=1):
+    results = []
+    for mode in modes:
+        for num_workers in with_baseline(workers):
+            for _ in range(warmup):
+                measure(mode, task, async_task, num_workers, tasks_per_worker)
+            runs = [
+                measure(mode, task, async_task, num_workers, tasks_per_worker) for _ in range(repeat)
+            ]
+
+            walls = [run["wall"] for run in runs]
+            wall = statistics.median(walls)
+            cpu = statistics.median(run["cpu"] for run in runs)
+            throughput = num_workers * tasks_per_worker / wall
+            results.append(
+                {
+                    "mode": mode,
+                    "workers": num_workers,
+                    "tasks": num_workers * tasks_per_worker,
+                    "wall_seconds": wall,
+                    "wall_min_seconds": min(walls),
+                    "wall_stdev_seconds": statistics.stdev(walls) if len(walls) > 1 else 0.0,
+                    "cpu_seconds": cpu,
+                    "cpu_utilization": cpu / wall,
+                    "tasks_per_second": throughput,
+                }
+            )
+            print(f"{mode} with {num_workers} workers: {wall:.3f} seconds", file=sys.stderr)
+    return add_scaling(results, "mode", "tasks_per_second")
+
+
+def child_argv(args):
+    # built from the parsed arguments, so no option of the parent (e.g. --compare-gil or --csv) reaches the children
+    argv = [
+        "--workload", args.workload,
+        "--number", str(args.number),
+        "--seconds", str(args.seconds),
+        "--modes", *args.modes,
+        "--oversubscription", str(args.oversubscription),
+        "--tasks-per-worker", str(args.tasks_per_worker),
+        "--warmup", str(args.warmup),
+        "--repeat", str(args.repeat),
+    ]
+    if args.url is not None:
+        argv += ["--url", args.url]
+    if args.workers:
+        argv += ["--workers", *map(str, args.workers)]
+    return argv
+
+
+def compare_gil(args):
+    """Run this script with the GIL enabled and, if possible, disabled."""
+    argv = child_argv(args)
+    env = dict(os.environ, **{COMPARE_GIL_CHILD: "1"})
+    settings = [("gil", "1")]
+    if free_threaded_build():
+        settings.append(("nogil", "0"))
+    else:
+        print(f"{gil_status()}: the GIL cannot be disabled, only the run with the GIL is possible")
+
+    report = {"results": []}
+    for label, gil in settings:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            subprocess.run(
+                [sys.executable, "-X", f"gil={gil}", os.path.abspath(__file__), *argv, "--output", path],
+                check=True,
+                env=env,
+            )
+            with open(path) as f:
+                run_report = json.load(f)
+        report[label] = {key: value for key, value in run_report.items() if key != "results"}
+        report["results"].extend(dict(r, gil=run_report["gil_enabled"]) for r in run_report["results"])
+
+    if "nogil" in report:
+        print("Speedup with the GIL disabled (same mode and number of workers):")
+        with_gil = {(r["mode"], r["workers"]): r for r in report["results"] if r["gil"]}
+        for r in report["results"]:
+            if not r["gil"] and (r["mode"], r["workers"]) in with_gil:
+                ratio = with_gil[(r["mode"], r["workers"])]["wall_seconds"] / r["wall_seconds"]
+                print(f"{r['mode']:<14}{r['workers']:>4} workers: {ratio:.2f}x")
+    save_report(report, args.output, args.csv)
+
+
+def print_table(results):
+    header = (
+        f"{'Mode':<14}{'Workers':>8}{'Wall s':>9}{'Stdev':>8}{'CPU s':>9}{'CPU/wall':>9}"
+        f"{'Tasks/s':>10}{'Speedup':>9}{'Effic.':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['mode']:<14}{r['workers']:>8}{r['wall_seconds']:>9.3f}{r['wall_stdev_seconds']:>8.3f}"
+            f"{r['cpu_seconds']:>9.3f}{r['cpu_utilization']:>9.2f}{r['tasks_per_second']:>10.2f}"
+            f"{r['speedup']:>9.2f}{r['efficiency']:>8.0%}"
+        )
+
+
+def save_report(report, output=None, csv_output=None):
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved in {output}")
+    if csv_output is not None and report["results"]:
+        with open(csv_output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(report["results"][0]))
+            writer.writeheader()
+            writer.writerows(report["results"])
+        print(f"Results saved in {csv_output}")
+
+
+def parse_args():
+    # no abbreviations: --compare-gil must be spelled out
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter, allow_abbrev=False
+    )
+    parser.add_argument(
+        "--workload", choices=WORKLOADS, default="factorial", help="Task executed by the workers"
+    )
+    parser.add_argument(
+        "--number", type=int, default=100000, help="Factorial calculated by the factorial workload"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=0.05, help="Duration of each task of the sleep workload"
+    )
+    parser.add_argument("--url", help="URL downloaded by the download workload")
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=MODES, help="Modes to run"
+    )
+    parser.add_argument(
+        "--workers",
+        type=worker_count,
+        nargs="+",
+        help="Numbers of workers to try (default: 1..number of CPU cores * oversubscription). 1 is always run, as the baseline",
+    )
+    parser.add_argument(
+        "--oversubscription", type=worker_count, default=2, help="Workers per CPU core, at most"
+    )
+    parser.add_argument(
+        "--tasks-per-worker", type=worker_count, default=1, help="Tasks executed by each worker"
+    )
+    parser.add_argument("--warmup", type=int, default=1, help="Runs before measuring")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured runs")
+    parser.add_argument(
+        "--output", default="executor_benchmark.json", help="Path of the JSON report"
+    )
+    parser.add_argument("--csv", help="Path of the CSV report")
+    parser.add_argument(
+        "--compare-gil",
+        action="store_true",
+        help="Run the benchmark with the GIL enabled and disabled (free-threaded builds only)",
+    )
+    args = parser.parse_args()
+    if args.workload == "download" and args.url is None:
+        parser.error("--url is required with --workload download")
+    if args.compare_gil and os.environ.get(COMPARE_GIL_CHILD):
+        parser.error("--compare-gil cannot be used in a child run of --compare-gil")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare_gil:
+        # the child runs write only the JSON report, the CSV report is written at the end with both runs
+        compare_gil(args)
+        raise SystemExit
+
+    print(gil_status(), file=sys.stderr)
+    workers = sorted(args.workers) if args.workers else default_workers(args.oversubscription)
+    task, async_task = make_workload(args.workload, args.number, args.seconds, args.url)
+
+    results = benchmark(
+        args.modes, workers, task, async_task, args.warmup, args.repeat, args.tasks_per_worker
+    )
+    print_table(results)
+    report = {
+        "workload": args.workload,
+        "number": args.number,
+        "seconds": args.seconds,
+        "url": args.url,
+        "cpu_count": multiprocessing.cpu_count(),
+        "python": sys.version,
+        "free_threaded_build": free_threaded_build(),
+        "gil_enabled": gil_enabled(),
+        "tasks_per_worker": args.tasks_per_worker,
+        "warmup": args.warmup,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    save_report(report, args.output, args.csv)
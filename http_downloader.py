@@ -0,0 +1,252 @@
+"""A downloader that shares one pool of keep-alive HTTP connections among all threads.
+
+Creating a new `urllib3.PoolManager` for every download means that no connection is ever reused:
+each download pays for a DNS lookup, a TCP handshake and (for HTTPS) a TLS handshake.
+A `PoolManager` is thread safe, so all threads can share a single one. It keeps a connection pool for each host,
+and a connection goes back to its pool as soon as the response has been read, ready for the next request to that host.
+With `block=True` a host never gets more than `max_connections` connections: when they are all busy,
+a thread waits for one to be released instead of opening a new one.
+Failed requests (connection errors, 429 and 5xx responses) are retried with an exponential backoff.
+
+The responses are streamed to disk: instead of holding the whole body in memory, each thread reads it in chunks
+of --chunk-size bytes into a buffer which it reuses for all its downloads. So the memory used by a download is bounded,
+whatever the size of the file.
+
+With --resume the progress of each download (bytes completed, ETag and Last-Modified validators) is recorded in a journal
+on disk, with an entry for each output file (several threads may download the same URL into different files). When an interrupted download is started again, it continues from the last recorded byte with a Range request
+(with If-Range, so the server sends the whole file if it changed in the meantime). When a completed download is started
+again, it is sent as a conditional GET (If-None-Match / If-Modified-Since), so an unchanged file is not downloaded at all.
+The journal is trusted only if it matches the file on disk: a file of a different size is downloaded again.
+Any other response (e.g. 404, or a 5xx still failing after the retries) raises a RuntimeError, and the file is left untouched.
+
+Usage:
+    $ python http_downloader.py
+    $ python http_downloader.py --repeat 20 --max-connections 4 --chunk-size 16384
+    $ python http_downloader.py --resume
+
+See Also:
+    create_threads_final.py
+    create_threads_java_like.py
+    create_threads_pythonic.py
+"""
+import os
+import json
+import time
+import urllib3
+import argparse
+import threading
+from argparse import RawDescriptionHelpFormatter
+
+# disable warning for untrusted certificates
+urllib3.disable_warnings()
+
+
+class DownloadJournal:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, file_name):
+        with self.lock:
+            entry = self.entries.get(file_name)
+            return dict(entry) if entry is not None else None
+
+    def update(self, file_name, **fields):
+        with self.lock:
+            self.entries.setdefault(file_name, {}).update(fields)
+            # write to a temporary file first, so an interrupted run never leaves a corrupted journal behind
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+
+
+class Downloader:
+
+    def __init__(
+        self,
+        max_connections=10,
+        max_hosts=100,
+        retries=3,
+        backoff_factor=0.5,
+        timeout=30.0,
+        chunk_size=64 * 1024,
+        journal=None,
+        journal_interval=1024 * 1024,
+    ):
+        self.chunk_size = chunk_size
+        # record the progress in the journal every journal_interval bytes
+        self.journal = journal
+        self.journal_interval = journal_interval
+        # each thread gets its own buffer, allocated once and reused for all its downloads
+        self.local = threading.local()
+        retry = urllib3.Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+        self.http = urllib3.PoolManager(
+            num_pools=max_hosts,
+            maxsize=max_connections,
+            block=True,
+            retries=retry,
+            timeout=urllib3.Timeout(total=timeout),
+        )
+
+    def buffer(self):
+        if getattr(self.local, "buffer", None) is None or len(self.local.buffer) != self.chunk_size:
+            self.local.buffer = bytearray(self.chunk_size)
+        return self.local.buffer
+
+    def request_headers(self, file_name, url):
+        entry = self.journal.get(file_name) if self.journal is not None else None
+        if entry is None or entry.get("url") != url or not os.path.exists(file_name):
+            return {}, 0
+
+        headers = {}
+        size = os.path.getsize(file_name)
+        if entry["complete"]:
+            if size != entry["bytes"]:
+                # the file was truncated or modified after the download: do not trust the journal
+                return headers, 0
+            # conditional GET: the server answers 304 Not Modified if the resource did not change
+            if entry["etag"] is not None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return headers, 0
+
+        validator = entry["etag"] or entry["last_modified"]
+        if validator is None:
+            return headers, 0
+        # the journal may be ahead of the file, if the process was killed before the last chunk was flushed
+        offset = min(entry["bytes"], size)
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+        return headers, offset
+
+    def download(self, file_name, url):
+        headers, offset = self.request_headers(file_name, url)
+        response = self.http.request(method="GET", url=url, headers=headers, preload_content=False)
+        try:
+            if response.status == 304:
+                return response.status
+            if response.status == 416:
+                # we already had every byte, but the download was not marked as complete: start over
+                offset = 0
+                response.release_conn()
+                response = self.http.request(method="GET", url=url, preload_content=False)
+            if response.status not in (200, 206):
+                # do not write an error page (or a redirect we could not follow) into the file
+                raise RuntimeError(f"Download of {url} failed with HTTP status {response.status}")
+            if response.status != 206:
+                offset = 0
+            journaled = self.journal is not None and response.status in (200, 206)
+            if journaled and response.status == 200:
+                self.journal.update(
+                    file_name,
+                    url=url,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    bytes=0,
+                    complete=False,
+                )
+
+            buffer = self.buffer()
+            view = memoryview(buffer)
+            last_recorded = offset
+            with open(file_name, "r+b" if offset else "wb") as f:
+                f.seek(offset)
+                f.truncate()
+                while True:
+                    n = response.readinto(buffer)
+                    if not n:
+                        break
+                    f.write(view[:n])
+                    offset += n
+                    if journaled and offset - last_recorded >= self.journal_interval:
+                        self.journal.update(file_name, bytes=offset)
+                        last_recorded = offset
+            if journaled:
+                self.journal.update(file_name, bytes=offset, complete=True)
+        finally:
+            # give the connection back to the pool for the next request
+            response.release_conn()
+        return response.status
+
+    def clear(self):
+        self.http.clear()
+
+
+# the downloader shared by all the threads of a script
+downloader = Downloader()
+
+
+def download_url(file_name, url):
+    return downloader.download(file_name, url)
+
+
+def add_resume_arguments(parser):
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume interrupted downloads and skip unchanged ones, with a journal on disk",
+    )
+    parser.add_argument(
+        "--journal", default=".download_journal.json", help="Path of the journal used with --resume"
+    )
+
+
+def make_downloader(args, **kwargs):
+    journal = DownloadJournal(args.journal) if args.resume else None
+    return Downloader(journal=journal, **kwargs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of times each URL is downloaded"
+    )
+    parser.add_argument(
+        "--max-connections", type=int, default=10, help="Maximum number of connections per host"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=64 * 1024, help="Size of the chunks read from each response"
+    )
+    add_resume_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    test_dict = {
+        "Google": "http://www.google.com",
+        "Python": "http://www.python.org",
+        "Bing": "http://www.bing.com",
+        "Yahoo": "http://www.yahoo.com",
+    }
+
+    downloader = make_downloader(args, max_connections=args.max_connections, chunk_size=args.chunk_size)
+    threads = []
+    start = time.time()
+    for key in test_dict:
+        for i in range(args.repeat):
+            thread = threading.Thread(
+                target=downloader.download, name=f"{key}-{i}", args=(f"{key}_{i}", test_dict[key])
+            )
+            threads.append(thread)
+            thread.start()
+
+    for thread in threads:
+        thread.join()
+    end = time.time()
+    print(f"{len(threads)} downloads with a shared connection pool took {(end - start):.2f} seconds")
+    downloader.clear()
@@ -1,17 +1,41 @@
 """Example of a IO bound operation.
 
+With --engine asyncio the downloads run concurrently in the main thread, on an asyncio event loop.
+With --engine segmented the file is downloaded only once: each thread fetches a different byte range of it (HTTP Range requests).
+With --resume the threads record their progress in a journal, so an interrupted run continues where it stopped,
+and a file that did not change on the server is not downloaded again.
+
 Usage:
-    $ python io_bound_operation.py
+    $ python io_bound_operation.py 4
+    $ python io_bound_operation.py 4 --engine asyncio
+    $ python io_bound_operation.py 4 --engine segmented
+    $ python io_bound_operation.py 4 --resume
+    # compare threads, processes, pools and asyncio with 1..4 concurrent downloads
+    $ python io_bound_operation.py 4 --benchmark
+
+See Also:
+    async_downloader.py
+    executor_benchmark.py
+    http_downloader.py
+    segmented_download.py
 """
 import time
 import urllib.request
 import argparse
 from argparse import RawDescriptionHelpFormatter
 from threading import Thread, current_thread
+from async_downloader import download_urls
+from executor_benchmark import MODES, benchmark, make_workload, print_table, worker_count
+from http_downloader import Downloader, DownloadJournal
+from segmented_download import segmented_download
 
 
-def download_file(url):
-    urllib.request.urlretrieve(url, "7zip{}.zip".format(str(current_thread().name)))
+def download_file(url, downloader=None):
+    file_name = "7zip{}.zip".format(str(current_thread().name))
+    if downloader is not None:
+        downloader.download(file_name, url)
+    else:
+        urllib.request.urlretrieve(url, file_name)
 
 
 def parse_args():
@@ -20,10 +44,25 @@ def parse_args():
     )
     parser.add_argument(
         "num_threads",
-        type=int,
-        choices=[1, 2, 3, 4],
+        type=worker_count,
         help="Number of threads to spawn and use",
     )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare threads, processes, pools and asyncio with 1..num_threads workers (see executor_benchmark.py)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio", "segmented"],
+        default="threads",
+        help="Download with one thread per download, with asyncio in a single thread, or one segment per thread",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume interrupted downloads and skip unchanged files (threads engine only)",
+    )
     return parser.parse_args()
 
 
@@ -31,15 +70,33 @@ if __name__ == "__main__":
     url = "http://www.7-zip.org/a/7z1701.msi"
     args = parse_args()
 
+    if args.benchmark:
+        task, async_task = make_workload("download", url=url)
+        print_table(benchmark(MODES, range(1, args.num_threads + 1), task, async_task))
+        raise SystemExit
+
     start = time.time()
-    threads = []
-    for _ in range(args.num_threads):
-        t = Thread(target=download_file, args=(url,))
-        threads.append(t)
-        t.start()
-    
-    for t in threads:
-        t.join()
+    if args.engine == "asyncio":
+        downloads = [(f"7zipAsync-{i}.zip", url) for i in range(args.num_threads)]
+        results = download_urls(downloads)
+        # download_urls returns the exceptions instead of raising them, so one failure does not cancel the others
+        failed = [result for result in results if isinstance(result, Exception)]
+        for result in failed:
+            print(f"Download of {url} failed: {result!r}")
+        if failed:
+            raise SystemExit(f"{len(failed)}/{len(downloads)} asyncio downloads failed")
+    elif args.engine == "segmented":
+        segmented_download(url, "7zipSegmented.zip", args.num_threads)
+    else:
+        downloader = Downloader(journal=DownloadJournal(".download_journal.json")) if args.resume else None
+        threads = []
+        for _ in range(args.num_threads):
+            t = Thread(target=download_file, args=(url, downloader))
+            threads.append(t)
+            t.start()
+
+        for t in threads:
+            t.join()
 
     end = time.time()
-    print(f"Processing with {args.num_threads} threads took {(end - start):.2f} seconds")
+    print(f"Processing with {args.num_threads} {args.engine} downloads took {(end - start):.2f} seconds")
@@ -5,8 +5,14 @@ A CONSUMER process GETS the data from the queue and produces the output.
 
 Queues are thread and process safe.
 
+A consumer cannot rely on `queue.empty()` to know when to stop: the queue is also empty when the producer is just slow.
+Instead, when the producer is done the main process puts a sentinel (None) in the queue for each consumer.
+A consumer stops as soon as it gets a sentinel, and since the sentinels come after all the items, no item is lost.
+So any number of consumer processes can drain the same queue.
+
 Usage:
     $ python message_passing_with_queue.py
+    $ python message_passing_with_queue.py --consumers 3
 """
 import time
 import random
@@ -36,15 +42,18 @@ class Consumer(multiprocessing.Process):
         self.queue = queue
 
     def run(self):
-        # not sure why we have to wait a few ms
-        time.sleep(2)
-        while not self.queue.empty():
+        while True:
+            item = self.queue.get()
+            # the sentinel: the producer is done and all the items have been consumed
+            if item is None:
+                break
             time.sleep(random.random())
-            x, y = self.queue.get()
+            x, y = item
             print(
                 f"Process {self.name} got ({x}, {y}) from the queue and produced {x*y}"
             )
 
+        print(f"Process {self.name}: no more data to consume...")
         self.queue.close()
 
 
@@ -52,6 +61,9 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
+    parser.add_argument(
+        "-c", "--consumers", type=int, default=1, help="Number of consumer processes"
+    )
     return parser.parse_args()
 
 
@@ -60,10 +72,15 @@ if __name__ == "__main__":
 
     queue = multiprocessing.Queue()
     p = Producer(queue)
-    c = Consumer(queue)
+    consumers = [Consumer(queue) for _ in range(args.consumers)]
 
     p.start()
-    c.start()
+    for c in consumers:
+        c.start()
 
     p.join()
-    c.join()
+    # one sentinel for each consumer, after all the items
+    for _ in consumers:
+        queue.put(None)
+    for c in consumers:
+        c.join()
@@ -0,0 +1,107 @@
+"""Render thumbnails of several sizes from a single decode of the source image.
+
+Decoding is usually the most expensive step of thumbnail generation, so we open and decode each source image only once.
+For JPEG images `Image.draft` asks the decoder to downscale while decoding (DCT scaling), so it never produces
+a full resolution bitmap when we only need a small one. Every other format is decoded at full resolution.
+The thumbnails are then produced in a cascade, from the largest to the smallest: each one is resized from the previous one,
+so every resize works on an image which is already small.
+
+When a single size is requested the thumbnail is saved as `<name>.t.png`, otherwise as `<name>.<width>x<height>.t.png`.
+
+Usage:
+    $ python multi_size_thumbnails.py --sizes 64 128 256 512
+
+See Also:
+    multiprocess_thumbnail_generation.py
+    pool_of_workers_thumbnail_generation.py
+"""
+import io
+import os
+import time
+import argparse
+from argparse import RawDescriptionHelpFormatter
+from PIL import Image
+from glob import glob
+
+
+DEFAULT_SIZES = ((128, 128),)
+
+
+def thumbnail_paths(image_file, sizes, fmt="png"):
+    file_name, ext = os.path.splitext(image_file)
+    if len(sizes) == 1:
+        return [f"{file_name}.t.{fmt}"]
+    return [f"{file_name}.{width}x{height}.t.{fmt}" for width, height in sizes]
+
+
+def open_image(fp, sizes):
+    image = Image.open(fp)
+    # only JPEG supports draft mode: the decoder picks the smallest scale which is still >= the largest size
+    image.draft(None, max(sizes, key=lambda size: size[0] * size[1]))
+    image.load()
+    return image
+
+
+def cascade(image, sizes):
+    # from the largest to the smallest size, so each thumbnail can be made from the previous one
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+    current = image
+    for i in order:
+        current = current.copy()
+        current.thumbnail(sizes[i])
+        yield i, current
+
+
+def render_thumbnails(image_file, sizes=DEFAULT_SIZES, fmt="png"):
+    paths = thumbnail_paths(image_file, sizes, fmt)
+    image = open_image(image_file, sizes)
+    for i, thumbnail in cascade(image, sizes):
+        thumbnail.save(paths[i], fmt)
+    return paths
+
+
+def encode_thumbnails(data, sizes=DEFAULT_SIZES, fmt="png"):
+    # same as render_thumbnails, but from the bytes of the source image to the bytes of each thumbnail (no file I/O)
+    encoded = [None] * len(sizes)
+    image = open_image(io.BytesIO(data), sizes)
+    for i, thumbnail in cascade(image, sizes):
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, fmt)
+        encoded[i] = buffer.getvalue()
+    return encoded
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[128],
+        help="Sizes (in pixels) of the square boxes the thumbnails must fit in",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sizes = [(size, size) for size in args.sizes]
+
+    image_dir = os.path.join(os.getcwd(), "data")
+    image_files = [f for f in glob(f"{image_dir}/*.png") if not f.endswith(".t.png")]
+
+    start = time.time()
+    for image_file in image_files:
+        paths = render_thumbnails(image_file, sizes)
+        thumb_names = ", ".join(os.path.basename(path) for path in paths)
+        print(f"Thumbnails created for {os.path.basename(image_file)}: {thumb_names}")
+    end = time.time()
+    print(f"Total time for thumbnail generation: {(end - start):.2f} seconds")
+
+    # cleanup
+    thumbnail_files = glob(f"{image_dir}/*.t.png")
+    for path in thumbnail_files:
+        print(f"REMOVE {path}")
+        os.unlink(path)
@@ -2,41 +2,144 @@
 
 Manually split the work across processes, to maximize the use of all CPU cores.
 
+A static split gives each process a contiguous chunk of images, so a process that gets a few huge images becomes
+the straggler while the others sit idle. With --dynamic the processes instead pull one image at a time from a shared
+task queue, until they find a sentinel, so all CPU cores are kept busy until the end.
+With --largest-first the biggest files are scheduled first, so no big image is left for the end of the run.
+In the static split the sorted images are then dealt round-robin (process i gets images i, i+N, i+2N...),
+so the biggest images are spread across all the processes instead of all landing in the first chunk.
+At the end each process reports how long it was busy and how long it was idle.
+An image which cannot be read or decoded is reported and skipped, it does not stop the process which got it.
+
 Usage:
     $ python multiprocess_thumbnail_generation.py
+    # schedule the images dynamically, largest first
+    $ python multiprocess_thumbnail_generation.py --dynamic --largest-first
+    # decode each image once and render thumbnails of several sizes
+    $ python multiprocess_thumbnail_generation.py --sizes 64 128 256 512
 
 See Also:
     message_passing_with_pipe.py
     message_passing_with_queue.py
+    multi_size_thumbnails.py
     pool_of_workers_thumbnail_generation.py
 """
 import os
 import time
+import queue
 import multiprocessing
 import argparse
 from argparse import RawDescriptionHelpFormatter
-from PIL import Image
 from glob import glob
+from multi_size_thumbnails import DEFAULT_SIZES, render_thumbnails, thumbnail_paths
+
+
+def thumbnail(image_file, sizes=DEFAULT_SIZES):
+    process_name = multiprocessing.current_process().name
+    img_name = os.path.basename(image_file)
+    try:
+        t_files = render_thumbnails(image_file, sizes)
+    except Exception as e:
+        print(f"{process_name}: Could not create a thumbnail for {img_name}: {e}")
+        return False
+    thumb_name = ", ".join(os.path.basename(t_file) for t_file in t_files)
+    print(f"{process_name}: Thumbnail created for {img_name} as {thumb_name}")
+    return True
+
+
+def create_thumbnail(image_files, report_queue=None, sizes=DEFAULT_SIZES):
+    busy = 0.0
+    count = 0
+    failed = 0
+    try:
+        for image_file in image_files:
+            t0 = time.perf_counter()
+            if not thumbnail(image_file, sizes):
+                failed += 1
+            busy += time.perf_counter() - t0
+            count += 1
+    finally:
+        # the main process waits for one report from each process, so it must be sent whatever happens
+        if report_queue is not None:
+            report_queue.put((multiprocessing.current_process().name, count, failed, busy))
+
+
+def create_thumbnail_from_queue(task_queue, report_queue=None, sizes=DEFAULT_SIZES):
+    busy = 0.0
+    count = 0
+    failed = 0
+    try:
+        while True:
+            image_file = task_queue.get()
+            # a None is the sentinel that tells this process there is no more work
+            if image_file is None:
+                break
+            t0 = time.perf_counter()
+            if not thumbnail(image_file, sizes):
+                failed += 1
+            busy += time.perf_counter() - t0
+            count += 1
+    finally:
+        if report_queue is not None:
+            report_queue.put((multiprocessing.current_process().name, count, failed, busy))
+
+
+def collect_reports(report_queue, processes):
+    # get the reports before joining, a process cannot exit while its data is still buffered in the queue.
+    # A process killed by a signal never sends its report, so we do not wait for it forever
+    reports = []
+    while len(reports) < len(processes):
+        try:
+            reports.append(report_queue.get(timeout=1.0))
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                # all the processes are gone: what they sent before exiting is already in the queue
+                while len(reports) < len(processes):
+                    try:
+                        reports.append(report_queue.get(timeout=0.1))
+                    except queue.Empty:
+                        break
+                break
+    for p in processes:
+        p.join()
+    reported = {process_name for process_name, *_ in reports}
+    for p in processes:
+        if p.name not in reported:
+            print(f"WARNING: {p.name} exited with code {p.exitcode} without sending its report")
+    return reports
 
 
-def create_thumbnail(image_files):
-    size = 128, 128
-    for image_file in image_files:
-        file_name, ext = os.path.splitext(image_file)
-        image = Image.open(image_file)
-        image.thumbnail(size)
-        t_file = f"{file_name}.t.png"
-        image.save(t_file, "png")
-        process_name = multiprocessing.current_process().name
-        img_name = os.path.basename(image_file)
-        thumb_name = os.path.basename(t_file)
-        print(f"{process_name}: Thumbnail created for {img_name} as {thumb_name}")
+def print_report(reports, elapsed):
+    print(f"{'Process':<14}{'Images':>8}{'Failed':>8}{'Busy (s)':>10}{'Idle (s)':>10}")
+    for process_name, count, failed, busy in sorted(reports):
+        print(f"{process_name:<14}{count:>8}{failed:>8}{busy:>10.2f}{(elapsed - busy):>10.2f}")
+    total_busy = sum(busy for _, _, _, busy in reports)
+    utilization = total_busy / (elapsed * len(reports)) if elapsed > 0 else 0.0
+    print(f"CPU utilization across processes: {utilization:.0%}")
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
+    parser.add_argument(
+        "-d",
+        "--dynamic",
+        action="store_true",
+        help="Pull the images from a shared task queue instead of splitting them statically",
+    )
+    parser.add_argument(
+        "--largest-first",
+        action="store_true",
+        help="Schedule the biggest image files first",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[128],
+        help="Sizes (in pixels) of the square boxes the thumbnails must fit in",
+    )
     return parser.parse_args()
 
 
@@ -47,36 +150,63 @@ if __name__ == "__main__":
     print(f"Detected {processor_count} CPU cores")
 
     image_dir = os.path.join(os.getcwd(), "data")
-    image_files = glob(f"{image_dir}/*.png")
-
-    # manually split the work across CPU cores
-    images_per_process = (int)(len(image_files) / processor_count) + 1
-    print(
-        f"{len(image_files)} images. Split work: {images_per_process} images per process"
-    )
+    # skip the thumbnails themselves, which may be kept in the same directory (pool_of_workers_thumbnail_generation.py --cache)
+    image_files = [f for f in glob(f"{image_dir}/*.png") if not f.endswith(".t.png")]
+    sizes = [(size, size) for size in args.sizes]
+    if args.largest_first:
+        image_files.sort(key=os.path.getsize, reverse=True)
 
+    report_queue = multiprocessing.Queue()
     processes = []
-    start = time.time()
-    for i in range(processor_count):
-        if (i + 1) * images_per_process > len(image_files):
-            image_file_subset = image_files[i * images_per_process:]
-        else:
-            image_file_subset = image_files[
-                i * images_per_process:(i + 1) * images_per_process
-            ]
-
-        p = multiprocessing.Process(target=create_thumbnail, args=(image_file_subset,))
-        processes.append(p)
-        p.start()
-
-    for p in processes:
-        p.join()
+    if args.dynamic:
+        print(f"{len(image_files)} images. Dynamic scheduling from a shared task queue")
+        task_queue = multiprocessing.Queue()
+        for image_file in image_files:
+            task_queue.put(image_file)
+        for _ in range(processor_count):
+            task_queue.put(None)
+
+        start = time.time()
+        for i in range(processor_count):
+            p = multiprocessing.Process(
+                target=create_thumbnail_from_queue, args=(task_queue, report_queue, sizes)
+            )
+            processes.append(p)
+            p.start()
+    else:
+        # manually split the work across CPU cores
+        images_per_process = (int)(len(image_files) / processor_count) + 1
+        print(
+            f"{len(image_files)} images. Split work: {images_per_process} images per process"
+        )
+
+        start = time.time()
+        for i in range(processor_count):
+            if args.largest_first:
+                # deal the sorted images like cards, so every process gets some big and some small images
+                image_file_subset = image_files[i::processor_count]
+            elif (i + 1) * images_per_process > len(image_files):
+                image_file_subset = image_files[i * images_per_process:]
+            else:
+                image_file_subset = image_files[
+                    i * images_per_process:(i + 1) * images_per_process
+                ]
+
+            p = multiprocessing.Process(
+                target=create_thumbnail, args=(image_file_subset, report_queue, sizes)
+            )
+            processes.append(p)
+            p.start()
+
+    reports = collect_reports(report_queue, processes)
 
     end = time.time()
     print(f"Total time for thumbnail generation: {(end - start):.2f} seconds")
+    print_report(reports, end - start)
 
-    # cleanup
-    thumbnail_files = glob(f"{image_dir}/*.t.png")
-    for path in thumbnail_files:
-        print(f"REMOVE {path}")
-        os.unlink(path)
+    # cleanup: only the thumbnails of this run, the ones kept by pool_of_workers_thumbnail_generation.py --cache stay
+    for image_file in image_files:
+        for path in thumbnail_paths(image_file, sizes):
+            if os.path.exists(path):
+                print(f"REMOVE {path}")
+                os.unlink(path)
@@ -7,41 +7,215 @@ When we use multiple processes, we can see that the PID is different.
 
 When we use multiple threads, we can see that the PID does not change.
 We are not spawning any new processes, so with multiple threads the PID is the one of the `MainProcess`.
+With the GIL the threads take turns, so they are not faster than a single thread. On a free-threaded build of CPython
+with the GIL disabled (python3.13t and later) they run in parallel, like the processes but without their startup cost.
+The script reports whether the GIL is enabled.
+
+Starting a process is not free: with the "spawn" and "forkserver" start methods the child has to start a new interpreter
+(or be forked from the fork server) and import this script and its modules before it can run the task.
+For a small factorial this startup cost dominates. With --warm we compare, round after round, fresh processes
+with a pool of warm workers which are started once and reused for all the rounds.
+With the forkserver start method the fork server preloads the modules imported by this script,
+so each new process is forked from an interpreter which already has them in memory.
+A pool of threads, which needs no startup at all, is measured as well.
+For each task we measure the startup latency (from the start of the round until the task begins to run in the worker,
+which is mostly the time to start the process, or the time to dispatch the task to a warm worker) and the compute time.
 
 Usage:
     $ python multiprocessing_multithreading_comparison.py 2
+    # fresh processes vs a warm pool, for 20 rounds of a small factorial
+    $ python multiprocessing_multithreading_comparison.py 4 --warm --number 2000 --rounds 20
+    $ python multiprocessing_multithreading_comparison.py 4 --warm --start-method spawn
+    # repeated measurements with 1..4 workers, with the CPU time used besides the wall time
+    $ python multiprocessing_multithreading_comparison.py 4 --benchmark
+
+See Also:
+    executor_benchmark.py
 """
 import time
 import argparse
+import statistics
+import multiprocessing
 from argparse import RawDescriptionHelpFormatter
 from multiprocessing import Process, current_process
+from multiprocessing.pool import ThreadPool
 from threading import Thread
+from executor_benchmark import (
+    MODES,
+    benchmark,
+    gil_enabled,
+    gil_status,
+    make_workload,
+    print_table,
+    worker_count,
+)
 
 
-def calculate_factorial(number):
-    print(f"{current_process().name} (PID:{current_process().pid})")
+# imported once by the fork server, instead of once by each new process
+PRELOAD_MODULES = ["executor_benchmark"]
+
+
+def factorial(number):
     fact = 1
     for i in range(1, number):
         fact *= i
     return fact
 
 
+def calculate_factorial(number):
+    print(f"{current_process().name} (PID:{current_process().pid})")
+    return factorial(number)
+
+
+def timed_factorial(number, result_queue=None):
+    # time.perf_counter uses CLOCK_MONOTONIC on Linux, so the parent can compare it with its own clock
+    start = time.perf_counter()
+    factorial(number)
+    timing = (start, time.perf_counter())
+    if result_queue is not None:
+        result_queue.put(timing)
+    return timing
+
+
+def wait_for_all(barrier):
+    # pool initializer: no worker takes a task before all the workers have started
+    barrier.wait()
+
+
+def ready():
+    return current_process().pid
+
+
+def fresh_processes_round(ctx, num_processes, number):
+    result_queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=timed_factorial, args=(number, result_queue)) for _ in range(num_processes)
+    ]
+    start = time.perf_counter()
+    for proc in processes:
+        proc.start()
+    timings = [result_queue.get() for _ in processes]
+    for proc in processes:
+        proc.join()
+    return time.perf_counter() - start, start, timings
+
+
+def warm_pool_round(pool, num_processes, number):
+    start = time.perf_counter()
+    timings = pool.map(timed_factorial, [number] * num_processes, chunksize=1)
+    return time.perf_counter() - start, start, timings
+
+
+def summarize(rounds):
+    # startup latency: from the start of the round until the task starts running in the worker
+    latencies = [task_start - start for _, start, timings in rounds for task_start, _ in timings]
+    computes = [end - task_start for _, _, timings in rounds for task_start, end in timings]
+    return {
+        "total": sum(wall for wall, _, _ in rounds),
+        "round": statistics.mean(wall for wall, _, _ in rounds),
+        "latency": statistics.mean(latencies),
+        "max_latency": max(latencies),
+        "compute": statistics.mean(computes),
+    }
+
+
+def print_summary(label, summary):
+    print(
+        f"{label:<18}{summary['total'] * 1000:>10.1f}{summary['round'] * 1000:>10.1f}"
+        f"{summary['latency'] * 1000:>10.2f}{summary['max_latency'] * 1000:>10.2f}"
+        f"{summary['compute'] * 1000:>12.2f}"
+    )
+
+
+def compare_warm_pool(num_processes, number, rounds, start_method):
+    ctx = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        # the fork server imports the heavy modules (executor_benchmark imports asyncio, urllib, concurrent.futures...)
+        # once, and every process is forked from it with these modules already imported.
+        # Each process still runs this script as __mp_main__, but its imports are then found in sys.modules
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+
+    # not measured: with forkserver, the first process also starts the fork server
+    fresh_processes_round(ctx, 1, number)
+
+    fresh = [fresh_processes_round(ctx, num_processes, number) for _ in range(rounds)]
+
+    start = time.perf_counter()
+    barrier = ctx.Barrier(num_processes)
+    with ctx.Pool(num_processes, initializer=wait_for_all, initargs=(barrier,)) as pool:
+        # returns once every worker has passed the barrier, i.e. all the workers are up and ready
+        pool.apply(ready)
+        pool_startup = time.perf_counter() - start
+        warm = [warm_pool_round(pool, num_processes, number) for _ in range(rounds)]
+    with ThreadPool(num_processes) as pool:
+        threaded = [warm_pool_round(pool, num_processes, number) for _ in range(rounds)]
+
+    fresh_summary = summarize(fresh)
+    warm_summary = summarize(warm)
+    print(
+        f"{rounds} rounds of {num_processes} tasks (factorial of {number}), start method: {start_method}"
+    )
+    header = f"{'':<18}{'Total ms':>10}{'Round ms':>10}{'Start ms':>10}{'Max ms':>10}{'Compute ms':>12}"
+    print(header)
+    print("-" * len(header))
+    print_summary("Fresh processes", fresh_summary)
+    print_summary("Warm pool", warm_summary)
+    print_summary("Thread pool", summarize(threaded))
+    print(f"The warm pool took {pool_startup * 1000:.1f} ms to start, once")
+    total = pool_startup + warm_summary["total"]
+    print(
+        f"Warm pool including its startup: {total * 1000:.1f} ms, "
+        f"{fresh_summary['total'] / total:.1f}x faster than fresh processes"
+    )
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
     parser.add_argument(
         "num_processes",
-        type=int,
-        choices=[1, 2, 3, 4],
+        type=worker_count,
         help="Number of processes to spawn and use",
     )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare threads, processes, pools and asyncio with 1..num_processes workers (see executor_benchmark.py)",
+    )
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Compare fresh processes with a pool of warm workers, reused for all the rounds",
+    )
+    parser.add_argument(
+        "--start-method",
+        choices=multiprocessing.get_all_start_methods(),
+        default="forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+        help="Start method of the processes used with --warm",
+    )
+    parser.add_argument(
+        "--rounds", type=worker_count, default=10, help="Rounds of tasks run with --warm"
+    )
+    parser.add_argument(
+        "--number", type=int, default=50000, help="Calculate the factorial of this number"
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
-    num = 50000
     args = parse_args()
+    num = args.number
+    print(gil_status())
+
+    if args.warm:
+        compare_warm_pool(args.num_processes, num, args.rounds, args.start_method)
+        raise SystemExit
+
+    if args.benchmark:
+        task, async_task = make_workload("factorial", number=num)
+        print_table(benchmark(MODES, range(1, args.num_processes + 1), task, async_task))
+        raise SystemExit
 
     processes = []
     start = time.time()
@@ -74,3 +248,5 @@ if __name__ == "__main__":
     print(
         f"Threads: It took {(end - start):.2f} seconds with {args.num_processes} threads"
     )
+    if not gil_enabled():
+        print("The GIL is disabled, so the threads calculated the factorials in parallel")
@@ -0,0 +1,209 @@
+"""Generate thumbnail images with a pipeline of stages: read -> decode/resize/encode -> write.
+
+Reading and writing files is IO bound, while decoding, resizing and encoding an image is CPU bound.
+Here the IO bound stages run in threads, and the CPU bound stage runs in a pool of processes.
+The stages are connected by bounded queues: when a stage is slower than the previous one its input queue fills up,
+and the previous stage blocks on `put` (backpressure). So the memory used by the pipeline stays bounded,
+disk IO overlaps with computation, and the worker processes never wait on the filesystem.
+An image which cannot be read, decoded or written is reported and skipped. Each stage sends its sentinels downstream
+whatever happens, so a failure never leaves the next stage waiting forever.
+
+    feeder -> path_queue -> readers -> read_queue -> dispatcher -> ProcessPoolExecutor
+                                                                        |
+                              writers <- write_queue <- collector <- future_queue
+
+Usage:
+    $ python pipelined_thumbnail_generation.py
+    $ python pipelined_thumbnail_generation.py --readers 4 --writers 4 --queue-size 32 --sizes 64 128 256
+
+See Also:
+    multi_size_thumbnails.py
+    pool_of_workers_thumbnail_generation.py
+    producer_consumer_queue.py
+"""
+import os
+import time
+import queue
+import threading
+import multiprocessing
+import argparse
+from argparse import RawDescriptionHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from multi_size_thumbnails import thumbnail_paths, encode_thumbnails
+
+
+def feed(image_files, path_queue, num_readers):
+    try:
+        for image_file in image_files:
+            path_queue.put(image_file)
+    finally:
+        # one sentinel for each reader thread
+        for _ in range(num_readers):
+            path_queue.put(None)
+
+
+def read(path_queue, read_queue):
+    try:
+        while True:
+            image_file = path_queue.get()
+            if image_file is None:
+                break
+            try:
+                with open(image_file, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                print(f"Could not read {os.path.basename(image_file)}: {e}")
+                continue
+            read_queue.put((image_file, data))
+    finally:
+        read_queue.put(None)
+
+
+def dispatch(executor, read_queue, future_queue, num_readers, sizes):
+    finished_readers = 0
+    failed = False
+    try:
+        while finished_readers < num_readers:
+            item = read_queue.get()
+            if item is None:
+                finished_readers += 1
+                continue
+            if failed:
+                # keep draining read_queue, otherwise the readers (and the feeder behind them) block on put forever
+                continue
+            image_file, data = item
+            try:
+                future = executor.submit(encode_thumbnails, data, sizes)
+            except Exception as e:
+                # e.g. BrokenProcessPool when a worker process died abruptly
+                print(f"Could not submit {os.path.basename(image_file)}, skipping the remaining images: {e}")
+                failed = True
+                continue
+            # future_queue is bounded, so this limits the number of images in flight in the process pool
+            future_queue.put((image_file, future))
+    finally:
+        future_queue.put(None)
+
+
+def collect(future_queue, write_queue, num_writers, sizes):
+    try:
+        while True:
+            item = future_queue.get()
+            if item is None:
+                break
+            image_file, future = item
+            try:
+                encoded = future.result()
+            except Exception as e:
+                print(f"Could not create a thumbnail for {os.path.basename(image_file)}: {e}")
+                continue
+            write_queue.put((image_file, thumbnail_paths(image_file, sizes), encoded))
+    finally:
+        for _ in range(num_writers):
+            write_queue.put(None)
+
+
+def write(write_queue):
+    while True:
+        item = write_queue.get()
+        if item is None:
+            break
+        image_file, t_files, encoded = item
+        img_name = os.path.basename(image_file)
+        try:
+            for t_file, data in zip(t_files, encoded):
+                with open(t_file, "wb") as f:
+                    f.write(data)
+        except OSError as e:
+            print(f"Could not write the thumbnail for {img_name}: {e}")
+            continue
+        thumb_name = ", ".join(os.path.basename(t_file) for t_file in t_files)
+        print(f"{threading.current_thread().name}: Thumbnail created for {img_name} as {thumb_name}")
+
+
+def run_pipeline(image_files, sizes, num_processes, num_readers, num_writers, queue_size):
+    path_queue = queue.Queue(maxsize=queue_size)
+    read_queue = queue.Queue(maxsize=queue_size)
+    future_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        threads = [
+            threading.Thread(target=feed, args=(image_files, path_queue, num_readers), name="Feeder"),
+            threading.Thread(
+                target=dispatch,
+                args=(executor, read_queue, future_queue, num_readers, sizes),
+                name="Dispatcher",
+            ),
+            threading.Thread(
+                target=collect, args=(future_queue, write_queue, num_writers, sizes), name="Collector"
+            ),
+        ]
+        threads += [
+            threading.Thread(target=read, args=(path_queue, read_queue), name=f"Reader-{i}")
+            for i in range(num_readers)
+        ]
+        threads += [
+            threading.Thread(target=write, args=(write_queue,), name=f"Writer-{i}")
+            for i in range(num_writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of worker processes for the decode/resize/encode stage",
+    )
+    parser.add_argument(
+        "--readers", type=int, default=2, help="Number of threads reading the images"
+    )
+    parser.add_argument(
+        "--writers", type=int, default=2, help="Number of threads writing the thumbnails"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        help="Capacity of each queue between two stages",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[128],
+        help="Sizes (in pixels) of the square boxes the thumbnails must fit in",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sizes = [(size, size) for size in args.sizes]
+
+    image_dir = os.path.join(os.getcwd(), "data")
+    image_files = [f for f in glob(f"{image_dir}/*.png") if not f.endswith(".t.png")]
+    print(
+        f"{len(image_files)} images. {args.readers} readers, {args.processes} processes, {args.writers} writers"
+    )
+
+    start = time.time()
+    run_pipeline(image_files, sizes, args.processes, args.readers, args.writers, args.queue_size)
+    end = time.time()
+    print(f"Total time for thumbnail generation: {(end - start):.2f} seconds")
+
+    # cleanup: only the thumbnails of this run, the ones kept by pool_of_workers_thumbnail_generation.py --cache stay
+    for image_file in image_files:
+        for path in thumbnail_paths(image_file, sizes):
+            if os.path.exists(path):
+                print(f"REMOVE {path}")
+                os.unlink(path)
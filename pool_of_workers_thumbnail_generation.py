@@ -2,40 +2,254 @@
 
 The `multiprocessing.Pool` class represents a pool of worker processes. It provides an abstraction to split the tasks across processes.
 
+With --cache the thumbnails are kept on disk, together with an index of what was generated.
+Each entry of the index is keyed by the content hash of the source image, the thumbnail size and the output format,
+so on a re-run only the images that changed (or that were never seen before) are decoded again.
+Thumbnails whose source image disappeared are evicted, and the index never grows beyond --cache-max-entries (least recently used first).
+An entry is used when its thumbnails are generated or found up to date; the entries of images which were not part of a run
+(e.g. a run over a subset of the images) keep the time they were last used, so they are the first to go.
+Note that the images of the current run are all used, so with a cap smaller than the number of images some thumbnails are evicted
+at the end of every run, and generated again on the next one.
+
+With --stream the image tree is walked lazily with `os.scandir` and the paths are fed to the pool with `imap_unordered`,
+so the results are available as soon as each thumbnail is done, and the number of paths in flight never exceeds --max-pending,
+whatever the size of the directory.
+
 Usage:
     $ python pool_of_workers_thumbnail_generation.py
+    # keep the thumbnails and skip unchanged images on the next run
+    $ python pool_of_workers_thumbnail_generation.py --cache
+    # walk the data directory recursively and stream the results as they complete
+    $ python pool_of_workers_thumbnail_generation.py --stream --chunksize 16
+    # decode each image once and render thumbnails of several sizes
+    $ python pool_of_workers_thumbnail_generation.py --sizes 64 128 256 512
 
 See Also:
     message_passing_with_pipe.py
     message_passing_with_queue.py
     multiprocess_thumbnail_generation.py
+    multi_size_thumbnails.py
 """
 import os
+import json
 import time
+import hashlib
+import threading
 import multiprocessing
 import argparse
 from argparse import RawDescriptionHelpFormatter
-from PIL import Image
 from glob import glob
+from multi_size_thumbnails import DEFAULT_SIZES, thumbnail_paths, render_thumbnails
+
+
+THUMBNAIL_FORMAT = "png"
+CACHE_INDEX_NAME = ".thumbnail_cache.json"
+
+# cache entries of the previous run and thumbnail sizes, set in each worker by the pool initializer
+cache_entries = None
+thumbnail_sizes = DEFAULT_SIZES
+
+
+def init_worker(entries, sizes):
+    global cache_entries, thumbnail_sizes
+    cache_entries = entries
+    thumbnail_sizes = sizes
+
+
+def file_digest(path, chunk_size=1 << 16):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_key(digest, sizes, fmt):
+    boxes = ",".join(f"{width}x{height}" for width, height in sizes)
+    return f"{digest}-{boxes}-{fmt}"
+
+
+def lookup_digest(image_file, stat):
+    # avoid reading (and hashing) the source image when its size and mtime did not change since the last run
+    entry = cache_entries.get(image_file)
+    if entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["bytes"] == stat.st_size:
+        return entry["digest"]
+    return file_digest(image_file)
 
 
 def create_thumbnail(image_file):
-    size = 128, 128
-    file_name, ext = os.path.splitext(image_file)
-    image = Image.open(image_file)
-    image.thumbnail(size)
-    t_file = f"{file_name}.t.png"
-    image.save(t_file, "png")
+    # an image which cannot be read or decoded must not stop the run: it is reported and skipped (no cache entry)
+    try:
+        return make_thumbnail(image_file)
+    except Exception as e:
+        process_name = multiprocessing.current_process().name
+        print(f"{process_name}: Could not create a thumbnail for {os.path.basename(image_file)}: {e}")
+        return None
+
+
+def make_thumbnail(image_file):
+    sizes = thumbnail_sizes
+    t_files = thumbnail_paths(image_file, sizes, THUMBNAIL_FORMAT)
     process_name = multiprocessing.current_process().name
     img_name = os.path.basename(image_file)
-    thumb_name = os.path.basename(t_file)
+    thumb_name = ", ".join(os.path.basename(t_file) for t_file in t_files)
+
+    entry = None
+    if cache_entries is not None:
+        stat = os.stat(image_file)
+        digest = lookup_digest(image_file, stat)
+        key = cache_key(digest, sizes, THUMBNAIL_FORMAT)
+        entry = {
+            "key": key,
+            "source": image_file,
+            "digest": digest,
+            "mtime_ns": stat.st_mtime_ns,
+            "bytes": stat.st_size,
+            "thumbnails": t_files,
+            "last_used": time.time(),
+        }
+        cached = cache_entries.get(image_file)
+        if cached is not None and cached["key"] == key and all(map(os.path.exists, t_files)):
+            print(f"{process_name}: Thumbnail for {img_name} is up to date in {thumb_name}")
+            return entry
+
+    render_thumbnails(image_file, sizes, THUMBNAIL_FORMAT)
     print(f"{process_name}: Thumbnail created for {img_name} as {thumb_name}")
+    return entry
+
+
+def load_cache_index(path):
+    try:
+        with open(path) as f:
+            return json.load(f)["entries"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_cache_index(path, entries):
+    # write to a temporary file first, so an interrupted run never leaves a corrupted index behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"entries": entries}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def evict(entry, keep=()):
+    for path in entry["thumbnails"]:
+        if path not in keep and os.path.exists(path):
+            print(f"EVICT {path}")
+            os.unlink(path)
+
+
+def update_cache_index(old_entries, new_entries, max_entries):
+    # the images which could not be processed have no entry
+    new_entries = [entry for entry in new_entries if entry is not None]
+    entries = {entry["source"]: entry for entry in new_entries}
+
+    # evict stale entries, i.e. the ones whose source image was removed or that were rendered at other sizes
+    for source, entry in old_entries.items():
+        current = entries.get(source)
+        if current is None and os.path.exists(source) and all(map(os.path.exists, entry["thumbnails"])):
+            # not part of this run, but still valid: keep it, with the time it was really last used
+            entries[source] = entry
+            continue
+        evict(entry, keep=current["thumbnails"] if current is not None else ())
+
+    if len(new_entries) > max_entries:
+        print(
+            f"WARNING: {len(new_entries)} images in this run but at most {max_entries} cache entries, "
+            "the evicted thumbnails will be generated again on the next run"
+        )
+
+    # enforce the size cap, evicting the least recently used entries first
+    if len(entries) > max_entries:
+        by_age = sorted(entries.values(), key=lambda e: e["last_used"])
+        for entry in by_age[: len(entries) - max_entries]:
+            del entries[entry["source"]]
+            evict(entry)
+
+    return entries
+
+
+def iter_image_files(image_dir, ext=".png"):
+    # a generator, so we never hold the whole listing of the directory tree in memory
+    with os.scandir(image_dir) as it:
+        for dir_entry in it:
+            if dir_entry.is_dir(follow_symlinks=False):
+                yield from iter_image_files(dir_entry.path, ext)
+            elif dir_entry.name.endswith(ext) and not dir_entry.name.endswith(f".t{ext}"):
+                yield dir_entry.path
+
+
+def bounded(iterable, semaphore, stopped):
+    for item in iterable:
+        semaphore.acquire()
+        if stopped.is_set():
+            return
+        yield item
+
+
+def stream_thumbnails(pool, image_files, chunksize, max_pending):
+    # The pool consumes its input iterable in a background thread as fast as it can, so we throttle it with a
+    # semaphore released every time a result is consumed. At most `max_pending` paths are queued at any time.
+    # a chunk is submitted only when it is complete, so we must allow at least one full chunk in flight
+    semaphore = threading.Semaphore(max(max_pending, chunksize))
+    stopped = threading.Event()
+    results = pool.imap_unordered(
+        create_thumbnail, bounded(image_files, semaphore, stopped), chunksize=chunksize
+    )
+    try:
+        for result in results:
+            semaphore.release()
+            yield result
+    finally:
+        # if we stop consuming the results (e.g. on an error) the task handler thread of the pool may be blocked
+        # in semaphore.acquire, and the pool could never be terminated: wake it up, and make it stop feeding the pool
+        stopped.set()
+        semaphore.release()
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        help="Keep the thumbnails and skip the images that did not change since the last run",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=10000,
+        help="Maximum number of thumbnails kept in the cache",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Walk the image tree lazily and stream the results as they complete",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=1,
+        help="Number of images sent to a worker at once in streaming mode",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="Maximum number of images queued to the pool in streaming mode (default: 4 chunks per worker)",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[128],
+        help="Sizes (in pixels) of the square boxes the thumbnails must fit in",
+    )
     return parser.parse_args()
 
 
@@ -46,17 +260,47 @@ if __name__ == "__main__":
     print(f"Detected {processor_count} CPU cores")
 
     image_dir = os.path.join(os.getcwd(), "data")
-    image_files = glob(f"{image_dir}/*.png")
+    if args.stream:
+        image_files = iter_image_files(image_dir)
+    else:
+        # skip the thumbnails themselves, which are kept in the same directory when using the cache
+        image_files = [f for f in glob(f"{image_dir}/*.png") if not f.endswith(".t.png")]
+
+    index_path = os.path.join(image_dir, CACHE_INDEX_NAME)
+    entries = load_cache_index(index_path) if args.cache else None
+    sizes = [(size, size) for size in args.sizes]
 
     start = time.time()
-    pool = multiprocessing.Pool(processes=processor_count)
-    result = pool.map(func=create_thumbnail, iterable=image_files)
-    pool.close()
+    # the pool is terminated when leaving the with block, also when an error interrupts the run
+    with multiprocessing.Pool(
+        processes=processor_count, initializer=init_worker, initargs=(entries, sizes)
+    ) as pool:
+        if args.stream:
+            max_pending = args.max_pending or args.chunksize * processor_count * 4
+            result = []
+            for i, entry in enumerate(
+                stream_thumbnails(pool, image_files, args.chunksize, max_pending)
+            ):
+                if i == 0:
+                    print(f"First thumbnail ready after {(time.time() - start):.2f} seconds")
+                # without the cache there is nothing to keep, so memory does not grow with the number of images
+                if entry is not None:
+                    result.append(entry)
+        else:
+            result = pool.map(func=create_thumbnail, iterable=image_files)
     end = time.time()
     print(f"Total time for thumbnail generation: {(end - start):.2f} seconds")
 
-    # cleanup
-    thumbnail_files = glob(f"{image_dir}/*.t.png")
-    for path in thumbnail_files:
-        print(f"REMOVE {path}")
-        os.unlink(path)
+    if args.cache:
+        entries = update_cache_index(entries, result, args.cache_max_entries)
+        save_cache_index(index_path, entries)
+        print(f"{len(entries)} thumbnails in the cache index {index_path}")
+    else:
+        # cleanup
+        if args.stream:
+            thumbnail_files = glob(f"{image_dir}/**/*.t.png", recursive=True)
+        else:
+            thumbnail_files = glob(f"{image_dir}/*.t.png")
+        for path in thumbnail_files:
+            print(f"REMOVE {path}")
+            os.unlink(path)
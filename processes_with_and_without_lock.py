@@ -9,20 +9,51 @@ Try running this script a few times to catch this undesidered behavior.
 When a SYNCHRONIZATION primitive is used (e.g. Lock), we avoid these timing issues, so no race condition is triggered.
 Of course the synchronization will increase the running time.
 
+A SHARDED counter avoids both the race condition and the lock: each process gets its own slot in a shared array,
+and it is the only one writing it, so nobody can overwrite its updates. The value of the counter is the sum of the slots,
+computed when we read it. The slots are 64 bytes apart, so each one is on its own cache line and the processes
+do not slow each other down by writing to the same line (false sharing). With --flush-every K each process accumulates its updates in a local variable
+and adds them to its slot only every K iterations, so it touches the shared memory even less often.
+
+Note that a `Value` already carries its own lock: every read and write of `num.value` acquires it.
+So in the lock mode each iteration pays for two layers of synchronization: our Lock, and the internal lock of the Value.
+In the RAWVALUE mode we use a `RawValue` (no internal lock) protected by our Lock only.
+In the GETLOCK mode we use the internal lock of the Value instead, and we hold it for a batch of --batch-size updates,
+accessing the raw value with `get_obj()` while we hold it. Bigger batches mean fewer lock round-trips,
+but also that the other process waits longer for the lock. --sweep reports the throughput for several batch sizes.
+
 Usage:
     # without lock (sometimes produces undesidered output)
     $ python processes_with_and_without_lock.py
     # with lock (always produces desidered output)
     $ python processes_with_and_without_lock.py -l
+    # with a sharded counter (always produces desidered output, no lock)
+    $ python processes_with_and_without_lock.py --mode sharded --flush-every 1000
+    # one explicit lock around a RawValue
+    $ python processes_with_and_without_lock.py --mode rawvalue
+    # the internal lock of the Value, held for batches of 100 updates
+    $ python processes_with_and_without_lock.py --mode getlock --batch-size 100
+    # time all the modes
+    $ python processes_with_and_without_lock.py --all
+    # throughput of the getlock mode for several batch sizes
+    $ python processes_with_and_without_lock.py --sweep
 """
 import time
 import argparse
 from argparse import RawDescriptionHelpFormatter
-from multiprocessing import Process, Value, Lock
+from multiprocessing import Process, Value, Lock, RawArray, RawValue
 
 
 NUM_ITERATIONS = 100000
 
+MODES = ["nolock", "lock", "rawvalue", "getlock", "sharded"]
+
+SWEEP_BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+# each shard is on its own 64-byte cache line (8 slots of 8 bytes), so the processes do not invalidate
+# each other's cache line at every update (false sharing), as in shared_memory_ring.py
+SHARD_STRIDE = 8
+
 
 def increment(num, lock=None):
     for _ in range(NUM_ITERATIONS):
@@ -43,6 +74,77 @@ def decrement(num, lock=None):
             num.value = num.value - 1
 
 
+def update_shard(shards, index, delta, flush_every=1):
+    # only this process writes shards[index], so no lock is needed
+    local = 0
+    for i in range(1, NUM_ITERATIONS + 1):
+        local += delta
+        if i % flush_every == 0:
+            shards[index] += local
+            local = 0
+    shards[index] += local
+
+
+def update_raw(num, lock, delta):
+    # num is a RawValue, so our lock is the only synchronization
+    for _ in range(NUM_ITERATIONS):
+        with lock:
+            num.value += delta
+
+
+def update_batched(num, delta, batch_size):
+    lock = num.get_lock()
+    raw = num.get_obj()
+    for start in range(0, NUM_ITERATIONS, batch_size):
+        # while we hold the lock of the Value we can update the raw value directly, without locking it again
+        with lock:
+            for _ in range(min(batch_size, NUM_ITERATIONS - start)):
+                raw.value += delta
+
+
+def run(mode, flush_every=1, batch_size=1):
+    if mode == "sharded":
+        # one slot for each process, and the value of the counter is their sum
+        shards = RawArray("q", 2 * SHARD_STRIDE)
+        p1 = Process(target=update_shard, args=(shards, 0, 1, flush_every))
+        p2 = Process(target=update_shard, args=(shards, SHARD_STRIDE, -1, flush_every))
+        read = lambda: sum(shards[::SHARD_STRIDE])
+    elif mode == "rawvalue":
+        num = RawValue("i", 0)
+        lock = Lock()
+        p1 = Process(target=update_raw, args=(num, lock, 1))
+        p2 = Process(target=update_raw, args=(num, lock, -1))
+        read = lambda: num.value
+    elif mode == "getlock":
+        num = Value("i", 0)
+        p1 = Process(target=update_batched, args=(num, 1, batch_size))
+        p2 = Process(target=update_batched, args=(num, -1, batch_size))
+        read = lambda: num.value
+    else:
+        num = Value("i", 0)
+        if mode == "lock":
+            lock = Lock()
+            p1 = Process(target=increment, args=(num, lock))
+            p2 = Process(target=decrement, args=(num, lock))
+        else:
+            p1 = Process(target=increment, args=(num,))
+            p2 = Process(target=decrement, args=(num,))
+        read = lambda: num.value
+    print(f"BEFORE processing {read()}")
+
+    start = time.time()
+    p1.start()
+    p2.start()
+
+    p1.join()
+    p2.join()
+    end = time.time()
+
+    print(f"AFTER processing {read()}")
+    print(f"{(end-start):.2f} seconds")
+    return read(), end - start
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
@@ -53,30 +155,56 @@ def parse_args():
         action="store_true",
         help="Use a synchronization primitive for the processes (Lock)",
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=MODES,
+        help="How the processes update the shared counter (default: lock with -l, nolock otherwise)",
+    )
+    parser.add_argument(
+        "--flush-every",
+        type=int,
+        default=1,
+        help="In sharded mode, add the local updates to the shared slot every K iterations",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="In getlock mode, number of updates done while holding the lock",
+    )
+    parser.add_argument(
+        "-a", "--all", action="store_true", help="Run and time all the modes"
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Report the throughput of the getlock mode for several batch sizes",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
 
-    num = Value("i", 0)
-    print(f"BEFORE processing {num.value}")
-
-    if args.lock:
-        lock = Lock()
-        p1 = Process(target=increment, args=(num, lock))
-        p2 = Process(target=decrement, args=(num, lock))
+    # both processes do NUM_ITERATIONS updates
+    num_updates = 2 * NUM_ITERATIONS
+    if args.all:
+        results = []
+        for mode in MODES:
+            print(f"--- {mode}")
+            results.append((mode, *run(mode, args.flush_every, args.batch_size)))
+        print(f"{'Mode':<10}{'Result':>8}{'Seconds':>10}{'Updates/s':>14}")
+        for mode, value, seconds in results:
+            print(f"{mode:<10}{value:>8}{seconds:>10.2f}{num_updates / seconds:>14,.0f}")
+    elif args.sweep:
+        results = []
+        for batch_size in SWEEP_BATCH_SIZES:
+            print(f"--- getlock, batches of {batch_size}")
+            results.append((batch_size, *run("getlock", batch_size=batch_size)))
+        print(f"{'Batch':>8}{'Result':>8}{'Seconds':>10}{'Updates/s':>14}")
+        for batch_size, value, seconds in results:
+            print(f"{batch_size:>8}{value:>8}{seconds:>10.2f}{num_updates / seconds:>14,.0f}")
     else:
-        p1 = Process(target=increment, args=(num,))
-        p2 = Process(target=decrement, args=(num,))
-
-    start = time.time()
-    p1.start()
-    p2.start()
-
-    p1.join()
-    p2.join()
-    end = time.time()
-
-    print(f"AFTER processing {num.value}")
-    print(f"{(end-start):.2f} seconds")
+        mode = args.mode or ("lock" if args.lock else "nolock")
+        run(mode, args.flush_every, args.batch_size)
@@ -0,0 +1,63 @@
+"""Metrics for the producer - consumer demos: throughput, depth of the buffer over time and latency percentiles.
+
+Each item carries the time it was produced, so a consumer can compute how long the item waited in the buffer
+(enqueue-to-dequeue latency). A background thread samples the number of items in the buffer at a regular interval.
+The latencies are collected by each consumer in its own list, so measuring them does not add any contention.
+
+See Also:
+    producer_consumer_pattern.py
+    producer_consumer_queue.py
+"""
+import time
+import argparse
+import threading
+from benchmark_stats import percentile
+
+
+def positive_int(value):
+    # argparse type for the number of producers, consumers and items: with 0 there is nothing to measure
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def split_work(num_items, num_workers):
+    # the first workers get one item more, when the items cannot be split evenly
+    return [
+        num_items // num_workers + (1 if i < num_items % num_workers else 0)
+        for i in range(num_workers)
+    ]
+
+
+class DepthSampler(threading.Thread):
+
+    def __init__(self, depth, interval=0.001):
+        threading.Thread.__init__(self, name="DepthSampler", daemon=True)
+        self.depth = depth
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        start = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            self.samples.append((time.perf_counter() - start, self.depth()))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def print_report(num_items, elapsed, latencies, depth_samples, num_producers, num_consumers, num_points=10):
+    print(f"{num_producers} producers, {num_consumers} consumers, {num_items} items")
+    print(f"Throughput: {num_items / elapsed:,.0f} items/sec ({elapsed:.3f} seconds)")
+    for q in (50, 90, 99):
+        print(f"p{q} enqueue-to-dequeue latency: {percentile(latencies, q) * 1e6:,.1f} us")
+    print(f"max enqueue-to-dequeue latency: {max(latencies) * 1e6:,.1f} us")
+    if depth_samples:
+        depths = [depth for _, depth in depth_samples]
+        print(f"Buffer depth: mean {sum(depths) / len(depths):.1f}, max {max(depths)}")
+        step = max(1, len(depth_samples) // num_points)
+        timeline = ", ".join(f"{t * 1000:.0f}ms: {depth}" for t, depth in depth_samples[::step])
+        print(f"Buffer depth over time: {timeline}")
@@ -2,29 +2,82 @@
 
 This script goes on forever. Terminate it with Ctrl+C.
 
-Some producer/s thread/s produce/s some sort of data or item and put it into a SHARED buffer (here is a simple python list).
+Some producer/s thread/s produce/s some sort of data or item and put it into a SHARED buffer (here a ring buffer).
 Producer threads should not put more data than the buffer can contain.
 
 Some consumer/s thread/s fetch/es the data from the buffer.
 Consumer thread should not read from an empty buffer.
 
+The ring buffer is a list preallocated with a fixed capacity, plus the index of the oldest item and the number of items.
+Putting and getting an item are O(1), and never allocate memory.
+Two condition variables share the lock of the buffer: producers wait on `not_full` when the buffer is full
+(so a fast producer is slowed down to the pace of the consumers: backpressure), and consumers wait on `not_empty`
+when the buffer is empty. Every put wakes up a consumer and every get wakes up a producer, so no wakeup is lost,
+even with multiple producers and consumers.
+
+With --items the script does not go on forever: the producers share a fixed number of items, nobody sleeps,
+and at the end we get the throughput, the depth of the buffer over time and the latency percentiles.
+
 Usage:
     $ python producer_consumer_pattern.py
+    $ python producer_consumer_pattern.py --capacity 4 --producers 2 --consumers 3
+    # measure the throughput with a fixed workload
+    $ python producer_consumer_pattern.py --items 100000 --producers 4 --consumers 4 --capacity 64
 
 See Also:
+    producer_consumer_metrics.py
     producer_consumer_queue.py
 """
 import time
+import queue
 import random
 import argparse
 import threading
 from argparse import RawDescriptionHelpFormatter
-
-# we use a list to act as the shared buffer
-operands = []
-
-# event used to understand whether the shared buffer is accessible or not
-event = threading.Event()
+from producer_consumer_metrics import DepthSampler, positive_int, print_report, split_work
+
+
+class RingBuffer:
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = [None] * capacity
+        # index of the oldest item, and number of items in the buffer
+        self.head = 0
+        self.count = 0
+        lock = threading.Lock()
+        self.not_full = threading.Condition(lock)
+        self.not_empty = threading.Condition(lock)
+
+    def __len__(self):
+        with self.not_empty:
+            return self.count
+
+    def put(self, item, timeout=None):
+        with self.not_full:
+            while self.count == self.capacity:
+                if not self.not_full.wait(timeout):
+                    raise queue.Full
+            self.items[(self.head + self.count) % self.capacity] = item
+            self.count += 1
+            self.not_empty.notify()
+
+    def get(self, timeout=None):
+        with self.not_empty:
+            while self.count == 0:
+                if not self.not_empty.wait(timeout):
+                    raise queue.Empty
+            item = self.items[self.head]
+            # drop the reference, so the buffer does not keep consumed items alive
+            self.items[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            self.not_full.notify()
+            return item
+
+
+# the shared buffer, created in main with the capacity given on the command line
+operands = None
 
 
 class Producer(threading.Thread):
@@ -32,10 +85,9 @@ class Producer(threading.Thread):
     def run(self):
         while True:
             (x, y) = random.randint(1, 100000), random.randint(1, 100000)
-            operands.append((x, y))
+            # blocks while the buffer is full
+            operands.put((x, y))
             print(f"{self.name} added: ({x}, {y})")
-            # set an event to communicate that the buffer can be read by a consumer thread
-            event.set()
             time.sleep(random.random())
 
 
@@ -44,22 +96,86 @@ class Consumer(threading.Thread):
     def run(self):
         while True:
             time.sleep(random.random())
-            # wait for an event to avoid reading from an empty buffer. This event is set by the producer thread
-            event.wait()
-            (x, y) = operands.pop()
+            # blocks while the buffer is empty
+            (x, y) = operands.get()
             print(f"Product of ({x}*{y}) = {x*y}")
-            # clear the event, so the producer thread can set it again
-            event.clear()
+
+
+def produce(buffer, num_items):
+    for _ in range(num_items):
+        x, y = random.randint(1, 100000), random.randint(1, 100000)
+        buffer.put((time.perf_counter(), x, y))
+
+
+def consume(buffer, latencies):
+    while True:
+        item = buffer.get()
+        # None is the sentinel put in the buffer when all the producers are done
+        if item is None:
+            break
+        produced_at, x, y = item
+        latencies.append(time.perf_counter() - produced_at)
+        product = x * y
+
+
+def run_benchmark(buffer, num_items, num_producers, num_consumers):
+    latencies = [[] for _ in range(num_consumers)]
+    producers = [
+        threading.Thread(target=produce, args=(buffer, n), name=f"Producer-{i}")
+        for i, n in enumerate(split_work(num_items, num_producers))
+    ]
+    consumers = [
+        threading.Thread(target=consume, args=(buffer, latencies[i]), name=f"Consumer-{i}")
+        for i in range(num_consumers)
+    ]
+    sampler = DepthSampler(lambda: len(buffer))
+
+    start = time.perf_counter()
+    sampler.start()
+    for thread in producers + consumers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+    for _ in consumers:
+        buffer.put(None)
+    for thread in consumers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    all_latencies = [latency for consumer_latencies in latencies for latency in consumer_latencies]
+    print_report(num_items, elapsed, all_latencies, sampler.samples, num_producers, num_consumers)
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
+    parser.add_argument(
+        "--capacity", type=positive_int, default=10, help="Maximum number of items in the shared buffer"
+    )
+    parser.add_argument(
+        "-p", "--producers", type=positive_int, default=1, help="Number of producer threads"
+    )
+    parser.add_argument(
+        "-c", "--consumers", type=positive_int, default=1, help="Number of consumer threads"
+    )
+    parser.add_argument(
+        "-n",
+        "--items",
+        type=positive_int,
+        help="Produce a fixed number of items as fast as possible and report the throughput",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    Producer().start()
-    Consumer().start()
+    operands = RingBuffer(args.capacity)
+    if args.items is not None:
+        run_benchmark(operands, args.items, args.producers, args.consumers)
+    else:
+        for _ in range(args.producers):
+            Producer().start()
+        for _ in range(args.consumers):
+            Consumer().start()
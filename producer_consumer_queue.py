@@ -3,58 +3,199 @@
 The queue module implements multi-producer, multi-consumer queues.
 The Queue class implements a FIFO queue with all locking semantics required.
 
+With --batch-size the producer puts the items in the queue in batches, and the consumer gets them in batches,
+so the lock of the queue is acquired once per batch instead of once per item.
+
+With --items the producers share a fixed number of items, nobody sleeps, and at the end we get the throughput,
+the depth of the queue over time and the latency percentiles.
+
 Usage:
     $ python producer_consumer_queue.py
+    $ python producer_consumer_queue.py --batch-size 4 --producers 2 --consumers 3
+    # measure the throughput with a fixed workload
+    $ python producer_consumer_queue.py --items 100000 --producers 4 --consumers 4 --maxsize 64 --batch-size 16
 
 See Also:
+    batched_queue.py
+    producer_consumer_metrics.py
     producer_consumer_pattern.py
 """
 import time
 import random
 import argparse
 import threading
-import queue
 from argparse import RawDescriptionHelpFormatter
+from batched_queue import BatchQueue
+from producer_consumer_metrics import DepthSampler, positive_int, print_report, split_work
 
 
 NUM_ITEMS = 10
 
-# create a FIFO queue
-q = queue.Queue()
+# create a FIFO queue (a BatchQueue is a queue.Queue which can also move items in batches)
+q = BatchQueue()
 
 
 class Producer(threading.Thread):
 
+    def __init__(self, num_items=NUM_ITEMS, batch_size=1):
+        threading.Thread.__init__(self)
+        self.num_items = num_items
+        self.batch_size = batch_size
+
     def run(self):
-        for i in range(NUM_ITEMS):
+        if self.batch_size > 1:
+            return self.run_batched()
+        for i in range(self.num_items):
             x, y = random.randint(1, 100000), random.randint(1, 100000)
             q.put((x, y))
             print(f"ITEM {i} added to FIFO queue")
             print(f"{self.name} added: ({x}, {y})")
             time.sleep(random.random())
 
+    def run_batched(self):
+        for start in range(0, self.num_items, self.batch_size):
+            batch = [
+                (random.randint(1, 100000), random.randint(1, 100000))
+                for _ in range(min(self.batch_size, self.num_items - start))
+            ]
+            q.put_many(batch)
+            print(f"ITEMS {start}-{start + len(batch) - 1} added to FIFO queue")
+            print(f"{self.name} added: {batch}")
+            time.sleep(random.random())
+
 
 class Consumer(threading.Thread):
 
+    def __init__(self, num_items=NUM_ITEMS, batch_size=1):
+        threading.Thread.__init__(self)
+        self.num_items = num_items
+        self.batch_size = batch_size
+
     def run(self):
-        for i in range(NUM_ITEMS):
+        if self.batch_size > 1:
+            return self.run_batched()
+        for i in range(self.num_items):
             time.sleep(random.random())
             x, y = q.get()
             print(f"Product of ({x}*{y}) = {x*y}")
             print(f"ITEM {i} processed")
             q.task_done()
 
+    def run_batched(self):
+        processed = 0
+        while processed < self.num_items:
+            time.sleep(random.random())
+            batch = q.get_many(min(self.batch_size, self.num_items - processed))
+            for x, y in batch:
+                print(f"Product of ({x}*{y}) = {x*y}")
+            print(f"ITEMS {processed}-{processed + len(batch) - 1} processed")
+            processed += len(batch)
+            q.task_done(len(batch))
+
+
+def produce(num_items, batch_size):
+    for start in range(0, num_items, batch_size):
+        n = min(batch_size, num_items - start)
+        produced_at = time.perf_counter()
+        batch = [
+            (produced_at, random.randint(1, 100000), random.randint(1, 100000)) for _ in range(n)
+        ]
+        if batch_size == 1:
+            q.put(batch[0])
+        else:
+            q.put_many(batch)
+
+
+def consume(batch_size, latencies):
+    while True:
+        batch = [q.get()] if batch_size == 1 else q.get_many(batch_size)
+        items = [item for item in batch if item is not None]
+        dequeued_at = time.perf_counter()
+        for produced_at, x, y in items:
+            latencies.append(dequeued_at - produced_at)
+            product = x * y
+        q.task_done(len(batch))
+        # None is the sentinel put in the queue when all the producers are done. The sentinels come after all
+        # the items, but a batch may contain more than one: give back the ones meant for the other consumers
+        sentinels = len(batch) - len(items)
+        if sentinels:
+            if sentinels > 1:
+                q.put_many([None] * (sentinels - 1))
+            break
+
+
+def run_benchmark(num_items, num_producers, num_consumers, batch_size):
+    latencies = [[] for _ in range(num_consumers)]
+    producers = [
+        threading.Thread(target=produce, args=(n, batch_size), name=f"Producer-{i}")
+        for i, n in enumerate(split_work(num_items, num_producers))
+    ]
+    consumers = [
+        threading.Thread(target=consume, args=(batch_size, latencies[i]), name=f"Consumer-{i}")
+        for i in range(num_consumers)
+    ]
+    sampler = DepthSampler(q.qsize)
+
+    start = time.perf_counter()
+    sampler.start()
+    for thread in producers + consumers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+    q.put_many([None] * num_consumers)
+    for thread in consumers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    all_latencies = [latency for consumer_latencies in latencies for latency in consumer_latencies]
+    print_report(num_items, elapsed, all_latencies, sampler.samples, num_producers, num_consumers)
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=RawDescriptionHelpFormatter
     )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Maximum number of items put in (or got from) the queue at once",
+    )
+    parser.add_argument(
+        "--maxsize", type=int, default=0, help="Capacity of the queue (0 means unbounded)"
+    )
+    parser.add_argument(
+        "-p", "--producers", type=positive_int, default=1, help="Number of producer threads"
+    )
+    parser.add_argument(
+        "-c", "--consumers", type=positive_int, default=1, help="Number of consumer threads"
+    )
+    parser.add_argument(
+        "-n",
+        "--items",
+        type=positive_int,
+        help="Produce a fixed number of items as fast as possible and report the throughput",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    Producer().start()
-    Consumer().start()
-    # make sure to lock the main thread until all items in the queue have been processed
-    q.join()
+    q = BatchQueue(args.maxsize)
+    if args.items is not None:
+        run_benchmark(args.items, args.producers, args.consumers, args.batch_size)
+    else:
+        # each producer produces NUM_ITEMS items, and the consumers share all of them
+        producers = [Producer(NUM_ITEMS, args.batch_size) for _ in range(args.producers)]
+        consumers = [
+            Consumer(n, args.batch_size)
+            for n in split_work(NUM_ITEMS * args.producers, args.consumers)
+        ]
+        for thread in producers + consumers:
+            thread.start()
+        for thread in producers:
+            thread.join()
+        # make sure to lock the main thread until all items in the queue have been processed
+        q.join()
@@ -0,0 +1,245 @@
+"""Download a single large file with several threads, each one fetching a different segment of it.
+
+Downloading the same file N times with N threads multiplies the bandwidth used, but does not make any download faster.
+Instead, if the server supports HTTP Range requests, we can split the file in N disjoint byte ranges and download them in parallel.
+The output file is preallocated, and each thread writes its segment at the right offset, either with `seek` + `write`
+or into a memory-mapped view of the file (--mmap). On high latency links a single connection rarely saturates the bandwidth,
+so this usually takes roughly 1/N of the time.
+At the end we verify that every segment was downloaded in full and, if a SHA-256 digest is given, that the file matches it.
+If the server does not support Range requests we fall back to a plain download.
+
+With --local the script starts a local HTTP server that supports Range requests, serving a file of random bytes,
+and downloads it from there.
+
+Usage:
+    $ python segmented_download.py http://www.7-zip.org/a/7z1701.msi 7zip.msi --segments 4
+    $ python segmented_download.py --local --size 50000000 --segments 8 --mmap
+
+See Also:
+    io_bound_operation.py
+"""
+import os
+import re
+import mmap
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import urllib.request
+import argparse
+from argparse import RawDescriptionHelpFormatter
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+# SimpleHTTPRequestHandler ignores the Range header, so we add support for single `bytes=start-end` ranges
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+
+    def send_head(self):
+        self.range_length = None
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        if start > end:
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Last-Modified", self.date_time_string(int(os.path.getmtime(path))))
+        self.end_headers()
+        self.range_length = end - start + 1
+        return f
+
+    def end_headers(self):
+        # tell the clients that they can ask for a range, also in the responses to HEAD and plain GET requests
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        length = self.range_length
+        if length is None:
+            return super().copyfile(source, outputfile)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            length -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_local_server(directory):
+    handler = partial(RangeRequestHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def probe(url):
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request) as response:
+        size = int(response.headers.get("Content-Length", 0))
+        accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        return size, accepts_ranges
+
+
+def split_ranges(size, num_segments):
+    segment_size = -(-size // num_segments)
+    return [
+        (start, min(start + segment_size, size) - 1)
+        for start in range(0, size, segment_size)
+    ]
+
+
+def download_segment(url, output, start, end, use_mmap, downloaded, index):
+    request = urllib.request.Request(url, headers={"Range": f"bytes={start}-{end}"})
+    with urllib.request.urlopen(request) as response:
+        if response.status != 206:
+            raise RuntimeError(f"Expected 206 Partial Content for bytes {start}-{end}, got {response.status}")
+        offset = start
+        if use_mmap:
+            # output is the memory map of the whole file, shared by all threads (the ranges are disjoint)
+            while offset <= end:
+                n = response.readinto(output[offset:end + 1])
+                if not n:
+                    break
+                offset += n
+        else:
+            with open(output, "r+b") as f:
+                f.seek(start)
+                while offset <= end:
+                    chunk = response.read(min(CHUNK_SIZE, end + 1 - offset))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    offset += len(chunk)
+    downloaded[index] = offset - start
+
+
+def segmented_download(url, file_name, num_segments, use_mmap=False):
+    size, accepts_ranges = probe(url)
+    if not accepts_ranges or size == 0:
+        print(f"{url} does not support Range requests, downloading it with a single thread")
+        urllib.request.urlretrieve(url, file_name)
+        return
+
+    ranges = split_ranges(size, num_segments)
+    # preallocate the output file, so each thread can write its segment at its offset
+    with open(file_name, "wb") as f:
+        f.truncate(size)
+
+    downloaded = [0] * len(ranges)
+    errors = []
+
+    def target(*args):
+        try:
+            download_segment(*args)
+        except Exception as e:
+            errors.append(e)
+
+    with open(file_name, "r+b") as f:
+        mm = mmap.mmap(f.fileno(), size) if use_mmap else None
+        output = memoryview(mm) if use_mmap else file_name
+        threads = []
+        for i, (start, end) in enumerate(ranges):
+            thread = threading.Thread(
+                target=target,
+                args=(url, output, start, end, use_mmap, downloaded, i),
+                name=f"Segment-{i}",
+            )
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if use_mmap:
+            output.release()
+            mm.flush()
+            mm.close()
+
+    if errors:
+        raise errors[0]
+    for (start, end), n in zip(ranges, downloaded):
+        if n != end - start + 1:
+            raise RuntimeError(f"Segment {start}-{end} is incomplete: {n} bytes downloaded")
+
+
+def sha256(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument("url", nargs="?", help="URL of the file to download")
+    parser.add_argument("file_name", nargs="?", help="Where to save the file")
+    parser.add_argument(
+        "--segments", type=int, default=4, help="Number of segments downloaded in parallel"
+    )
+    parser.add_argument(
+        "--mmap", action="store_true", help="Write the segments into a memory-mapped file"
+    )
+    parser.add_argument("--sha256", help="Expected SHA-256 digest of the file")
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Serve a file of random bytes with a local HTTP server and download it",
+    )
+    parser.add_argument(
+        "--size", type=int, default=10 * 1024 * 1024, help="Size of the file served with --local"
+    )
+    args = parser.parse_args()
+    if not args.local and (args.url is None or args.file_name is None):
+        parser.error("url and file_name are required, unless --local is used")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    server = None
+    if args.local:
+        serve_dir = tempfile.mkdtemp(prefix="segmented_download_")
+        with open(os.path.join(serve_dir, "random.bin"), "wb") as f:
+            f.write(os.urandom(args.size))
+        args.sha256 = sha256(os.path.join(serve_dir, "random.bin"))
+        server = start_local_server(serve_dir)
+        args.url = f"http://127.0.0.1:{server.server_address[1]}/random.bin"
+        args.file_name = args.file_name or "random.bin"
+
+    try:
+        start = time.time()
+        segmented_download(args.url, args.file_name, args.segments, args.mmap)
+        end = time.time()
+        print(
+            f"Download of {args.url} with {args.segments} segments took {(end - start):.2f} seconds"
+        )
+        if args.sha256 is not None:
+            if sha256(args.file_name) != args.sha256:
+                raise RuntimeError(f"SHA-256 digest of {args.file_name} does not match")
+            print(f"SHA-256 digest of {args.file_name} verified")
+    finally:
+        if server is not None:
+            server.shutdown()
+            shutil.rmtree(serve_dir)
+            os.unlink(args.file_name)
@@ -0,0 +1,189 @@
+"""A pool of shared memory buffers to hand decoded images from a process to another without copying them.
+
+Sending an image through a `Pipe` or a `Queue` pickles it, copies it into the kernel, and copies it again in the receiving process.
+`multiprocessing.Array` and `multiprocessing.Value` avoid this by placing the data in shared memory (see shared_data_with_processes.py).
+Here we go one step further with `multiprocessing.shared_memory`: a single shared memory block is split into a ring
+of fixed-size slabs, allocated once. A process LEASES a free slab, writes the decoded pixels in it and sends only
+the slab index (and a few bytes of metadata) to another process, which reads the pixels in place and RELEASES the slab
+when it is done with it. The free slabs are tracked with a queue of indices, so a process that needs a slab
+blocks until another one releases it: the number of slabs bounds the memory used, and gives us backpressure.
+
+In the demo, decoder processes decode the images into the slabs and resizer processes make the thumbnails from them.
+
+Usage:
+    $ python shared_memory_buffer_pool.py
+    $ python shared_memory_buffer_pool.py --decoders 2 --resizers 2 --slabs 8 --slab-size 16
+
+See Also:
+    shared_data_with_processes.py
+    pipelined_thumbnail_generation.py
+"""
+import os
+import time
+import multiprocessing
+import argparse
+from argparse import RawDescriptionHelpFormatter
+from multiprocessing import shared_memory
+from glob import glob
+from PIL import Image
+
+
+class SlabPool:
+
+    def __init__(self, num_slabs, slab_size):
+        self.num_slabs = num_slabs
+        self.slab_size = slab_size
+        self.shm = shared_memory.SharedMemory(create=True, size=num_slabs * slab_size)
+        self.free_slabs = multiprocessing.Queue()
+        for index in range(num_slabs):
+            self.free_slabs.put(index)
+
+    def __getstate__(self):
+        # a child process attaches to the same shared memory block by name, instead of receiving a copy of it
+        state = self.__dict__.copy()
+        state["shm"] = self.shm.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=state["shm"])
+
+    def lease(self, timeout=None):
+        return self.free_slabs.get(timeout=timeout)
+
+    def release(self, index):
+        self.free_slabs.put(index)
+
+    def view(self, index, nbytes=None):
+        start = index * self.slab_size
+        end = start + (self.slab_size if nbytes is None else nbytes)
+        return self.shm.buf[start:end]
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def decode(pool, path_queue, slab_queue):
+    process_name = multiprocessing.current_process().name
+    while True:
+        image_file = path_queue.get()
+        if image_file is None:
+            break
+        image = Image.open(image_file)
+        image.load()
+        # one byte per band, so the size of the pixel data is known from mode and size alone.
+        # Only these modes can be mapped by Image.frombuffer: RGB is padded to RGBX, otherwise the resizer would copy it
+        if image.mode == "RGB":
+            image = image.convert("RGBX")
+        elif image.mode not in ("L", "RGBX", "RGBA"):
+            image = image.convert("RGBA")
+        nbytes = len(image.mode) * image.width * image.height
+        if nbytes > pool.slab_size:
+            print(f"{process_name}: {os.path.basename(image_file)} does not fit in a slab ({nbytes} bytes)")
+            continue
+        index = pool.lease()
+        view = pool.view(index, nbytes)
+        # two copies: tobytes copies the decoded pixels into a bytes object, the slice assignment copies that into
+        # the shared memory. Pillow cannot decode straight into our buffer, but the resizer will not copy them again
+        view[:] = image.tobytes()
+        view.release()
+        slab_queue.put((image_file, index, image.mode, image.size))
+        print(f"{process_name}: {os.path.basename(image_file)} decoded in slab {index}")
+    pool.close()
+
+
+def resize(pool, slab_queue, size):
+    process_name = multiprocessing.current_process().name
+    while True:
+        item = slab_queue.get()
+        if item is None:
+            break
+        image_file, index, mode, image_size = item
+        nbytes = len(mode) * image_size[0] * image_size[1]
+        view = pool.view(index, nbytes)
+        # frombuffer maps the shared memory, it does not copy the pixels
+        image = Image.frombuffer(mode, image_size, view, "raw", mode, 0, 1)
+        thumbnail = image.resize(fit_size(image_size, size))
+        if mode == "RGBX":
+            # PNG has no RGBX mode: drop the padding byte, it is cheap on the small thumbnail
+            thumbnail = thumbnail.convert("RGB")
+        # drop every reference to the shared memory before giving the slab back
+        del image
+        view.release()
+        pool.release(index)
+
+        file_name, ext = os.path.splitext(image_file)
+        t_file = f"{file_name}.t.png"
+        thumbnail.save(t_file, "png")
+        img_name = os.path.basename(image_file)
+        thumb_name = os.path.basename(t_file)
+        print(f"{process_name}: Thumbnail created for {img_name} from slab {index} as {thumb_name}")
+    pool.close()
+
+
+def fit_size(image_size, box):
+    # same aspect-ratio preserving size that Image.thumbnail would compute
+    ratio = min(box[0] / image_size[0], box[1] / image_size[1], 1.0)
+    return max(1, round(image_size[0] * ratio)), max(1, round(image_size[1] * ratio))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--decoders", type=int, default=2, help="Number of decoder processes")
+    parser.add_argument("--resizers", type=int, default=2, help="Number of resizer processes")
+    parser.add_argument("--slabs", type=int, default=4, help="Number of slabs in the pool")
+    parser.add_argument(
+        "--slab-size", type=int, default=16, help="Size of each slab, in MiB"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    image_dir = os.path.join(os.getcwd(), "data")
+    image_files = [f for f in glob(f"{image_dir}/*.png") if not f.endswith(".t.png")]
+
+    pool = SlabPool(args.slabs, args.slab_size * 1024 * 1024)
+    print(f"{pool.num_slabs} slabs of {args.slab_size} MiB in shared memory block {pool.shm.name}")
+    path_queue = multiprocessing.Queue()
+    slab_queue = multiprocessing.Queue()
+    for image_file in image_files:
+        path_queue.put(image_file)
+    for _ in range(args.decoders):
+        path_queue.put(None)
+
+    start = time.time()
+    decoders = [
+        multiprocessing.Process(target=decode, args=(pool, path_queue, slab_queue), name=f"Decoder-{i}")
+        for i in range(args.decoders)
+    ]
+    resizers = [
+        multiprocessing.Process(target=resize, args=(pool, slab_queue, (128, 128)), name=f"Resizer-{i}")
+        for i in range(args.resizers)
+    ]
+    for proc in decoders + resizers:
+        proc.start()
+
+    for proc in decoders:
+        proc.join()
+    for _ in range(args.resizers):
+        slab_queue.put(None)
+    for proc in resizers:
+        proc.join()
+    end = time.time()
+    print(f"Total time for thumbnail generation: {(end - start):.2f} seconds")
+
+    pool.close()
+    pool.unlink()
+
+    # cleanup
+    thumbnail_files = glob(f"{image_dir}/*.t.png")
+    for path in thumbnail_files:
+        print(f"REMOVE {path}")
+        os.unlink(path)
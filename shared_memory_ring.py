@@ -0,0 +1,255 @@
+"""Single-producer / single-consumer ring buffer in shared memory, used as an alternative to Pipe and Queue.
+
+A `Pipe` or a `multiprocessing.Queue` copies every message into the kernel and back, and a `Queue` also needs
+a feeder thread and a lock. Here the two processes share a `multiprocessing.shared_memory` block instead:
+a ring of fixed-size slots, plus two counters. The producer is the only one writing the `tail` counter,
+and the consumer is the only one writing the `head` counter, so no lock is needed: the producer writes a message
+in slot `tail % capacity` and then increments `tail`, the consumer reads slot `head % capacity` and then increments `head`.
+The ring is full when `tail - head == capacity`, and empty when `tail == head`.
+When there is nothing to do, a process polls the counters, backing off with short sleeps.
+
+Note: this relies on the 8-byte counters being written in a single store, and on the CPU not reordering stores
+(true on x86-64). Python gives no such guarantee in general, so treat this as a demo of the technique.
+
+`ring_pipe` returns a (reader, writer) pair of connections, like `multiprocessing.Pipe(duplex=False)`.
+They provide `send`, `recv`, `send_bytes`, `recv_bytes`, `recv_bytes_into` and `close`, so the Producer and Consumer
+of message_passing_with_pipe.py work with them unchanged. Unlike a Pipe, closing the writer marks the end of the stream
+immediately, so the parent process must not close its copy of the writer.
+
+The script compares messages/sec and latency (from send to receive) of a Pipe, a Queue and the ring buffer.
+
+Usage:
+    $ python shared_memory_ring.py
+    $ python shared_memory_ring.py --messages 200000 --capacity 1024
+    # run the Producer and Consumer of message_passing_with_pipe.py over the ring buffer
+    $ python shared_memory_ring.py --demo --batch-size 100
+
+See Also:
+    message_passing_with_pipe.py
+    message_passing_with_queue.py
+    shared_memory_buffer_pool.py
+"""
+import time
+import pickle
+import struct
+import multiprocessing
+import argparse
+from argparse import RawDescriptionHelpFormatter
+from multiprocessing import shared_memory
+from message_passing_with_pipe import Producer, Consumer
+from benchmark_stats import percentile
+
+
+# head and tail are on separate cache lines, so the two processes do not invalidate each other's cache line
+HEAD_OFFSET = 0
+TAIL_OFFSET = 64
+CLOSED_OFFSET = 72
+HEADER_SIZE = 128
+LENGTH = struct.Struct("I")
+COUNTER = struct.Struct("q")
+
+
+class RingConnection:
+
+    def __init__(self, name, capacity, slot_size, writable):
+        self.name = name
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.writable = writable
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+
+    def __getstate__(self):
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "slot_size": self.slot_size,
+            "writable": self.writable,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def load(self, offset):
+        return COUNTER.unpack_from(self.buf, offset)[0]
+
+    def store(self, offset, value):
+        COUNTER.pack_into(self.buf, offset, value)
+
+    def slot_offset(self, counter):
+        return HEADER_SIZE + (counter % self.capacity) * (LENGTH.size + self.slot_size)
+
+    def wait(self, ready):
+        # spin for a while, then back off with sleeps of increasing length (up to 1 ms)
+        delay = 0.0
+        while not ready():
+            time.sleep(delay)
+            delay = min(max(delay * 2, 1e-6), 1e-3)
+
+    def send_bytes(self, data):
+        data = memoryview(data).cast("B")
+        if len(data) > self.slot_size:
+            raise ValueError(f"Message of {len(data)} bytes does not fit in a slot of {self.slot_size} bytes")
+        tail = self.load(TAIL_OFFSET)
+        self.wait(lambda: tail - self.load(HEAD_OFFSET) < self.capacity)
+        offset = self.slot_offset(tail)
+        LENGTH.pack_into(self.buf, offset, len(data))
+        self.buf[offset + LENGTH.size:offset + LENGTH.size + len(data)] = data
+        # publish the message only after it has been written
+        self.store(TAIL_OFFSET, tail + 1)
+
+    def send(self, obj):
+        self.send_bytes(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def next_message(self):
+        head = self.load(HEAD_OFFSET)
+        self.wait(lambda: self.load(TAIL_OFFSET) > head or self.load(CLOSED_OFFSET))
+        if self.load(TAIL_OFFSET) == head:
+            raise EOFError
+        offset = self.slot_offset(head)
+        length = LENGTH.unpack_from(self.buf, offset)[0]
+        return head, offset + LENGTH.size, length
+
+    def recv_bytes_into(self, buffer):
+        head, start, length = self.next_message()
+        memoryview(buffer).cast("B")[:length] = self.buf[start:start + length]
+        self.store(HEAD_OFFSET, head + 1)
+        return length
+
+    def recv_bytes(self):
+        head, start, length = self.next_message()
+        data = bytes(self.buf[start:start + length])
+        self.store(HEAD_OFFSET, head + 1)
+        return data
+
+    def recv(self):
+        return pickle.loads(self.recv_bytes())
+
+    def close(self):
+        if self.buf is None:
+            return
+        if self.writable:
+            # end of the stream: the reader gets EOFError once it has read all the messages
+            self.store(CLOSED_OFFSET, 1)
+        self.buf.release()
+        self.buf = None
+        self.shm.close()
+
+
+def ring_pipe(capacity=1024, slot_size=256):
+    # the caller owns the shared memory block, and must unlink it with destroy_ring when the processes are done
+    size = HEADER_SIZE + capacity * (LENGTH.size + slot_size)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+    reader = RingConnection(shm.name, capacity, slot_size, writable=False)
+    writer = RingConnection(shm.name, capacity, slot_size, writable=True)
+    shm.close()
+    return reader, writer
+
+
+def destroy_ring(conn):
+    shared_memory.SharedMemory(name=conn.name).unlink()
+
+
+def send_messages(transport, endpoint, num_messages):
+    for i in range(num_messages):
+        # time.perf_counter uses CLOCK_MONOTONIC on Linux, so it can be compared across processes
+        message = (time.perf_counter(), i)
+        if transport == "queue":
+            endpoint.put(message)
+        else:
+            endpoint.send(message)
+    if transport == "queue":
+        endpoint.put(None)
+    else:
+        endpoint.close()
+
+
+def receive_messages(transport, endpoint, result_queue):
+    latencies = []
+    while True:
+        if transport == "queue":
+            message = endpoint.get()
+            if message is None:
+                break
+        else:
+            try:
+                message = endpoint.recv()
+            except EOFError:
+                break
+        latencies.append(time.perf_counter() - message[0])
+    result_queue.put(latencies)
+
+
+def measure(transport, num_messages, capacity):
+    if transport == "pipe":
+        reader, writer = multiprocessing.Pipe(duplex=False)
+    elif transport == "queue":
+        reader = writer = multiprocessing.Queue(capacity)
+    else:
+        reader, writer = ring_pipe(capacity)
+
+    result_queue = multiprocessing.Queue()
+    producer = multiprocessing.Process(target=send_messages, args=(transport, writer, num_messages))
+    consumer = multiprocessing.Process(target=receive_messages, args=(transport, reader, result_queue))
+    start = time.perf_counter()
+    producer.start()
+    if transport == "pipe":
+        # the consumer gets EOFError only when every copy of the sending end is closed,
+        # so we close it before the consumer process is forked (as in message_passing_with_pipe.py)
+        writer.close()
+    consumer.start()
+    latencies = result_queue.get()
+    elapsed = time.perf_counter() - start
+    producer.join()
+    consumer.join()
+    if transport == "ring":
+        destroy_ring(reader)
+    return num_messages / elapsed, latencies
+
+
+def run_demo(num_pairs, batch_size, capacity):
+    # 16 bytes per pair, in binary frames of batch_size pairs (see message_passing_with_pipe.py)
+    recv, send = ring_pipe(capacity, slot_size=max(256, 16 * batch_size))
+    p = Producer(conn=send, num_pairs=num_pairs, batch_size=batch_size)
+    c = Consumer(conn=recv, batch_size=batch_size)
+    p.start()
+    c.start()
+    p.join()
+    c.join()
+    destroy_ring(recv)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--messages", type=int, default=100000, help="Number of messages sent in each benchmark"
+    )
+    parser.add_argument(
+        "--capacity", type=int, default=1024, help="Number of slots in the ring (and capacity of the Queue)"
+    )
+    parser.add_argument(
+        "--demo",
+        action="store_true",
+        help="Run the Producer and Consumer of message_passing_with_pipe.py over the ring buffer",
+    )
+    parser.add_argument(
+        "-b", "--batch-size", type=int, default=1, help="Pairs per frame in the demo"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.demo:
+        run_demo(args.messages, args.batch_size, args.capacity)
+    else:
+        print(f"{'Transport':<10}{'Messages/s':>12}{'p50 us':>10}{'p99 us':>10}")
+        for transport in ("pipe", "queue", "ring"):
+            throughput, latencies = measure(transport, args.messages, args.capacity)
+            p50 = percentile(latencies, 50) * 1e6
+            p99 = percentile(latencies, 99) * 1e6
+            print(f"{transport:<10}{throughput:>12,.0f}{p50:>10.1f}{p99:>10.1f}")
@@ -0,0 +1,287 @@
+"""Benchmark the thumbnail generation strategies of this repository.
+
+A corpus of synthetic images (random noise over a gradient, so they do not compress too well) is generated first.
+Then every strategy is run with 1..N workers. Each run is repeated a few times, after some warmup runs that are not measured.
+Each measurement runs in a fresh process, so the peak RSS reported is the one of that measurement only.
+
+Strategies:
+    static      one process per contiguous chunk of images (multiprocess_thumbnail_generation.py)
+    dynamic     processes pulling the images from a shared task queue (multiprocess_thumbnail_generation.py --dynamic)
+    pool        multiprocessing.Pool.map (pool_of_workers_thumbnail_generation.py)
+    pipeline    threads for IO and a process pool for the CPU work (pipelined_thumbnail_generation.py)
+
+For each strategy and number of workers we report images/sec, median (p50) and p99 per-image latency
+(not available for the pipeline, where each image crosses several stages), peak RSS, and the speedup and
+efficiency with respect to the same strategy with 1 worker (a run with 1 worker is always included, even if it is not
+in --workers). The results are printed as a table and saved as JSON.
+
+Usage:
+    $ python thumbnail_benchmark.py
+    $ python thumbnail_benchmark.py --count 200 --width 1920 --height 1080 --format jpeg --workers 1 2 4 8
+    $ python thumbnail_benchmark.py --strategies pool dynamic --repeat 5 --output results.json
+
+See Also:
+    multiprocess_thumbnail_generation.py
+    pool_of_workers_thumbnail_generation.py
+    pipelined_thumbnail_generation.py
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import statistics
+import contextlib
+import multiprocessing
+import argparse
+from argparse import RawDescriptionHelpFormatter
+from glob import glob
+from PIL import Image
+from benchmark_stats import add_scaling, percentile, with_baseline
+import multiprocess_thumbnail_generation
+import pool_of_workers_thumbnail_generation
+import pipelined_thumbnail_generation
+
+
+STRATEGIES = ["static", "dynamic", "pool", "pipeline"]
+EXTENSIONS = {"png": "png", "jpeg": "jpg"}
+
+
+def make_corpus(directory, count, width, height, fmt):
+    ext = EXTENSIONS[fmt]
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image_files = []
+    for i in range(count):
+        noise = Image.effect_noise((width, height), 32 + i % 64)
+        image = Image.merge("RGB", (noise, gradient, gradient.rotate(180)))
+        path = os.path.join(directory, f"image_{i:06d}.{ext}")
+        image.save(path, fmt)
+        image_files.append(path)
+    return image_files
+
+
+def remove_thumbnails(directory):
+    for path in glob(f"{directory}/*.t.png"):
+        os.unlink(path)
+
+
+def split(image_files, num_workers):
+    images_per_worker = len(image_files) // num_workers + 1
+    return [
+        image_files[i * images_per_worker:(i + 1) * images_per_worker]
+        for i in range(num_workers)
+    ]
+
+
+def timed_thumbnail(image_file, sizes):
+    t0 = time.perf_counter()
+    multiprocess_thumbnail_generation.thumbnail(image_file, sizes)
+    return time.perf_counter() - t0
+
+
+def static_worker(image_files, sizes, latency_queue):
+    latency_queue.put([timed_thumbnail(image_file, sizes) for image_file in image_files])
+
+
+def dynamic_worker(task_queue, sizes, latency_queue):
+    latencies = []
+    while True:
+        image_file = task_queue.get()
+        if image_file is None:
+            break
+        latencies.append(timed_thumbnail(image_file, sizes))
+    latency_queue.put(latencies)
+
+
+def pool_task(image_file):
+    t0 = time.perf_counter()
+    pool_of_workers_thumbnail_generation.create_thumbnail(image_file)
+    return time.perf_counter() - t0
+
+
+def run_processes(target, args_per_worker, latency_queue):
+    processes = [multiprocessing.Process(target=target, args=args) for args in args_per_worker]
+    for p in processes:
+        p.start()
+    latencies = []
+    for _ in processes:
+        latencies.extend(latency_queue.get())
+    for p in processes:
+        p.join()
+    return latencies
+
+
+def run_strategy(strategy, image_files, num_workers, sizes):
+    latency_queue = multiprocessing.Queue()
+    if strategy == "static":
+        chunks = split(image_files, num_workers)
+        return run_processes(
+            static_worker, [(chunk, sizes, latency_queue) for chunk in chunks], latency_queue
+        )
+    if strategy == "dynamic":
+        task_queue = multiprocessing.Queue()
+        for image_file in image_files:
+            task_queue.put(image_file)
+        for _ in range(num_workers):
+            task_queue.put(None)
+        return run_processes(
+            dynamic_worker, [(task_queue, sizes, latency_queue)] * num_workers, latency_queue
+        )
+    if strategy == "pool":
+        with multiprocessing.Pool(
+            processes=num_workers,
+            initializer=pool_of_workers_thumbnail_generation.init_worker,
+            initargs=(None, sizes),
+        ) as pool:
+            return pool.map(pool_task, image_files)
+    if strategy == "pipeline":
+        pipelined_thumbnail_generation.run_pipeline(
+            image_files, sizes, num_workers, num_readers=2, num_writers=2, queue_size=4 * num_workers
+        )
+        return []
+    raise ValueError(f"Unknown strategy {strategy}")
+
+
+def measure(strategy, image_files, num_workers, sizes, result_queue):
+    # the thumbnail functions print a line for each image, which would only add noise to the measurement
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        latencies = run_strategy(strategy, image_files, num_workers, sizes)
+        wall = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    result_queue.put({"wall": wall, "latencies": latencies, "peak_rss_kib": peak_rss})
+
+
+def measure_in_subprocess(strategy, image_files, num_workers, sizes):
+    result_queue = multiprocessing.Queue()
+    p = multiprocessing.Process(
+        target=measure, args=(strategy, image_files, num_workers, sizes, result_queue)
+    )
+    p.start()
+    result = result_queue.get()
+    p.join()
+    return result
+
+
+def benchmark(strategies, workers, image_files, sizes, warmup, repeat):
+    directory = os.path.dirname(image_files[0])
+    results = []
+    for strategy in strategies:
+        for num_workers in with_baseline(workers):
+            for _ in range(warmup):
+                measure_in_subprocess(strategy, image_files, num_workers, sizes)
+                remove_thumbnails(directory)
+            runs = []
+            for _ in range(repeat):
+                runs.append(measure_in_subprocess(strategy, image_files, num_workers, sizes))
+                remove_thumbnails(directory)
+
+            wall = statistics.median(run["wall"] for run in runs)
+            latencies = [latency for run in runs for latency in run["latencies"]]
+            throughput = len(image_files) / wall
+            results.append(
+                {
+                    "strategy": strategy,
+                    "workers": num_workers,
+                    "wall_seconds": wall,
+                    "images_per_second": throughput,
+                    "p50_latency_seconds": percentile(latencies, 50),
+                    "p99_latency_seconds": percentile(latencies, 99),
+                    "peak_rss_kib": max(run["peak_rss_kib"] for run in runs),
+                }
+            )
+            print(f"{strategy} with {num_workers} workers: {throughput:.1f} images/sec", file=sys.stderr)
+    return add_scaling(results, "strategy", "images_per_second")
+
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+def print_table(results):
+    header = f"{'Strategy':<10}{'Workers':>8}{'Images/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'RSS MiB':>9}{'Speedup':>9}{'Effic.':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['strategy']:<10}{r['workers']:>8}{r['images_per_second']:>10.1f}"
+            f"{format_ms(r['p50_latency_seconds']):>9}{format_ms(r['p99_latency_seconds']):>9}"
+            f"{r['peak_rss_kib'] / 1024:>9.1f}{r['speedup']:>9.2f}{r['efficiency']:>8.0%}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--count", type=int, default=48, help="Number of images in the corpus")
+    parser.add_argument("--width", type=int, default=1280, help="Width of the images")
+    parser.add_argument("--height", type=int, default=800, help="Height of the images")
+    parser.add_argument(
+        "--format", choices=sorted(EXTENSIONS), default="png", help="Format of the images"
+    )
+    parser.add_argument(
+        "--strategies", nargs="+", choices=STRATEGIES, default=STRATEGIES, help="Strategies to run"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=list(range(1, multiprocessing.cpu_count() + 1)),
+        help="Numbers of workers to try (default: 1..number of CPU cores). 1 is always run, as the baseline",
+    )
+    parser.add_argument("--warmup", type=int, default=1, help="Runs before measuring")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured runs")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[128],
+        help="Sizes (in pixels) of the square boxes the thumbnails must fit in",
+    )
+    parser.add_argument(
+        "--output", default="thumbnail_benchmark.json", help="Path of the JSON report"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sizes = [(size, size) for size in args.sizes]
+
+    corpus_dir = tempfile.mkdtemp(prefix="thumbnail_benchmark_")
+    try:
+        print(
+            f"Generating {args.count} {args.width}x{args.height} {args.format} images in {corpus_dir}",
+            file=sys.stderr,
+        )
+        image_files = make_corpus(corpus_dir, args.count, args.width, args.height, args.format)
+        results = benchmark(
+            args.strategies, sorted(args.workers), image_files, sizes, args.warmup, args.repeat
+        )
+    finally:
+        shutil.rmtree(corpus_dir)
+
+    print_table(results)
+    report = {
+        "corpus": {
+            "count": args.count,
+            "width": args.width,
+            "height": args.height,
+            "format": args.format,
+        },
+        "sizes": sizes,
+        "cpu_count": multiprocessing.cpu_count(),
+        "warmup": args.warmup,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved in {args.output}")